@@ -0,0 +1,245 @@
+"""
+Measures Cmpile's own build overhead on generated projects.
+
+Generates a synthetic C or C++ project and times four scenarios through
+CmpileBuilder.build_and_run(run=False) with the compilers on PATH:
+
+  cold          out/ and the object cache are empty
+  warm          out/ is empty but the object cache is populated
+  noop          nothing changed since the last build
+  header_touch  one deeply included header gained a definition
+
+Results are written as JSON and can be compared against a saved baseline:
+
+  python benchmark.py --tus 50 --depth 4 --output bench.json --baseline bench_baseline.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+
+import cmpile
+import object_cache
+import package_finder
+import vcpkg_automation
+
+SCENARIOS = ("cold", "warm", "noop", "header_touch")
+
+def _header_name(level, index, ext):
+    return f"bench_{level}_{index}{ext}"
+
+def generate_project(root, tus=20, headers=8, fanout=3, depth=3, language="cpp"):
+    """
+    Writes a project with `tus` translation units plus main, and `depth`
+    levels of `headers` headers each. Every TU includes `fanout` headers of
+    the first level and every header includes `fanout` headers of the next
+    one. Returns (source_files, touch_header), relative to root.
+    """
+    cpp = language == "cpp"
+    ext, src_ext = (".hpp", ".cpp") if cpp else (".h", ".c")
+    os.makedirs(root, exist_ok=True)
+
+    def picks(i):
+        return sorted({(i + k) % headers for k in range(fanout)})
+
+    for level in range(depth):
+        for i in range(headers):
+            name = f"bench_{level}_{i}"
+            children = picks(i) if level + 1 < depth else []
+            lines = ["#pragma once"]
+            lines += ["#include <vector>", "#include <numeric>"] if cpp else ["#include <stddef.h>"]
+            lines += [f'#include "{_header_name(level + 1, j, ext)}"' for j in children]
+            deps = " + ".join(f"bench_{level + 1}_{j}_get()" for j in children) or "0"
+            if cpp:
+                lines += [
+                    f"constexpr int {name}_value = {level * headers + i};",
+                    f"template <typename T> T {name}_sum(const std::vector<T>& v) {{",
+                    f"    return std::accumulate(v.begin(), v.end(), T({name}_value));",
+                    "}",
+                    f"inline int {name}_get() {{ return {name}_sum(std::vector<int>{{1, 2, 3}}) + {deps}; }}",
+                ]
+            else:
+                lines += [
+                    f"#define {name.upper()}_VALUE {level * headers + i}",
+                    f"static inline int {name}_get(void) {{ return {name.upper()}_VALUE + {deps}; }}",
+                ]
+            with open(os.path.join(root, _header_name(level, i, ext)), 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+
+    sources = []
+    for t in range(tus):
+        included = picks(t)
+        body = " + ".join(f"bench_0_{i}_get()" for i in included)
+        lines = [f'#include "{_header_name(0, i, ext)}"' for i in included]
+        lines += [f"int tu_{t}(void) {{ return {body}; }}"]
+        path = f"tu_{t}{src_ext}"
+        with open(os.path.join(root, path), 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        sources.append(path)
+
+    lines = [f"int tu_{t}(void);" for t in range(tus)]
+    lines += ["int main(void) {", "    int total = 0;"]
+    lines += [f"    total += tu_{t}();" for t in range(tus)]
+    lines += ["    return total == 0;", "}"]
+    with open(os.path.join(root, f"main{src_ext}"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+    return [f"main{src_ext}"] + sources, _header_name(depth - 1, 0, ext)
+
+def touch_header(path):
+    """Adds a new definition to a generated header, so its includers really need a rebuild."""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(f"static const int bench_touch_{time.time_ns()} = 1;\n")
+
+class _Collector:
+    """Keeps a build's log quiet unless the build fails."""
+    def __init__(self):
+        self.lines = []
+
+    def __call__(self, message, style=""):
+        self.lines.append(message)
+
+def _make_builder(project_dir, scratch_dir, profile, log):
+    builder = cmpile.CmpileBuilder(log_callback=log, profile=profile, working_dir=project_dir)
+    builder.object_cache = object_cache.ObjectCache(os.path.join(scratch_dir, "object_cache"))
+    # The generated projects have no vcpkg dependencies, so skip provisioning
+    # and point package resolution at an empty vcpkg root instead of the real one
+    builder._vcpkg_mgr = vcpkg_automation.VcpkgManager(scratch_dir, log_func=log)
+    builder._header_index = package_finder.HeaderIndex.load(builder._vcpkg_mgr.vcpkg_root)
+    return builder
+
+def time_build(project_dir, scratch_dir, files, profile, jobs=None):
+    """Runs one build in a fresh builder, like a CLI invocation. Returns its measurements."""
+    log = _Collector()
+    builder = _make_builder(project_dir, scratch_dir, profile, log)
+    start = time.perf_counter()
+    ok = builder.build_and_run(files, run=False, jobs=jobs)
+    wall = time.perf_counter() - start
+    if not ok:
+        raise RuntimeError("Benchmark build failed:\n" + "\n".join(log.lines[-40:]))
+    phases = {e["name"]: e["wall"] for e in builder.tracer.events if e["cat"] == "phase"}
+    compiles = [e for e in builder.tracer.events if e["cat"] == "compile"]
+    return {"wall": wall, "phases": phases, "compiled": len(compiles),
+            "cached": sum(1 for e in compiles if e["args"].get("cached"))}
+
+def run_scenarios(project_dir, scratch_dir, files, touched, profile, repeat=3, jobs=None, log_func=print):
+    """Times every scenario `repeat` times and returns {scenario: [measurement, ...]}."""
+    out_dir = os.path.join(project_dir, "out")
+    cache_dir = os.path.join(scratch_dir, "object_cache")
+    runs = {name: [] for name in SCENARIOS}
+    for round_number in range(repeat):
+        for name in SCENARIOS:
+            if name in ("cold", "warm"):
+                shutil.rmtree(out_dir, ignore_errors=True)
+            if name == "cold":
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            if name == "header_touch":
+                touch_header(os.path.join(project_dir, touched))
+            measurement = time_build(project_dir, scratch_dir, files, profile, jobs)
+            runs[name].append(measurement)
+            log_func(f"  round {round_number + 1}/{repeat} {name:<12} {measurement['wall'] * 1000:9.1f} ms"
+                     f"  ({measurement['compiled']} compiled, {measurement['cached']} cached)")
+    return runs
+
+def summarize(runs):
+    results = {}
+    for name, measurements in runs.items():
+        walls = [m["wall"] for m in measurements]
+        phase_names = sorted({p for m in measurements for p in m["phases"]})
+        results[name] = {
+            "wall": walls,
+            "min": min(walls),
+            "median": statistics.median(walls),
+            "phases": {p: statistics.median(m["phases"].get(p, 0.0) for m in measurements) for p in phase_names},
+            "compiled": measurements[-1]["compiled"],
+            "cached": measurements[-1]["cached"],
+        }
+    return results
+
+def compare(results, baseline, threshold=0.10, log_func=print):
+    """
+    Compares median wall times with a baseline's. Returns the scenarios that
+    got slower by more than `threshold` (as a fraction).
+    """
+    regressions = []
+    log_func(f"{'scenario':<12} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        change = result["median"] / base["median"] - 1 if base["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        log_func(f"{name:<12} {base['median'] * 1000:8.1f} ms {result['median'] * 1000:8.1f} ms {change * 100:+7.1f}%{flag}")
+    return regressions
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Cmpile's build overhead on a generated project.")
+    parser.add_argument("--tus", type=int, default=20, help="Number of translation units besides main.")
+    parser.add_argument("--headers", type=int, default=8, help="Headers per include level.")
+    parser.add_argument("--fanout", type=int, default=3, help="Headers included by each TU and header.")
+    parser.add_argument("--depth", type=int, default=3, help="Number of include levels.")
+    parser.add_argument("--language", choices=("cpp", "c"), default="cpp")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds of every scenario.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Parallel compile jobs.")
+    parser.add_argument("--compiler", help="Compiler to use instead of the one found on PATH.")
+    parser.add_argument("--dir", help="Where to generate the project (default: a temporary folder).")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated project.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results.")
+    parser.add_argument("--baseline", help="Results file to compare against.")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to --baseline as well.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Slowdown in percent reported as a regression.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    root = os.path.abspath(args.dir) if args.dir else tempfile.mkdtemp(prefix="cmpile-bench-")
+    project_dir = os.path.join(root, "project")
+    scratch_dir = os.path.join(root, "scratch")
+    profile = {}
+    if args.compiler:
+        profile = {"c_compiler": args.compiler, "cpp_compiler": args.compiler, "linker": args.compiler}
+
+    config = {k: getattr(args, k) for k in ("tus", "headers", "fanout", "depth", "language", "repeat", "jobs", "compiler")}
+    print(f"Generating project in {project_dir}: {config}")
+    try:
+        files, touched = generate_project(project_dir, args.tus, args.headers, args.fanout, args.depth, args.language)
+        runs = run_scenarios(project_dir, scratch_dir, files, touched, profile, args.repeat, args.jobs)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    results = summarize(runs)
+    report = {
+        "config": config,
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(),
+                 "compiler": args.compiler or cmpile.get_compiler_for_file("x." + args.language)},
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print(f"Results written to {args.output}")
+    for name, result in results.items():
+        print(f"{name:<12} median {result['median'] * 1000:9.1f} ms  min {result['min'] * 1000:9.1f} ms")
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("Warning: the baseline was measured with a different configuration.")
+        regressions = compare(results, baseline, args.threshold / 100)
+    if args.baseline and args.update_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import os
+import json
+import socket
+import secrets
+import threading
+import socketserver
+import concurrent.futures
+
+import cmpile
+import toolchain
+import build_state
+import startup_profile
+
+SERVER_INFO_PATH = os.path.join(cmpile.INTERNAL_DOWNLOADS, "build_server.json")
+
+# build_and_run options a client may pass through
+BUILD_OPTIONS = ("compiler_flags", "clean", "run", "jobs", "keep_going", "use_pch", "unity", "trace",
+                 "run_timeout", "memory_limit_mb", "project_file", "targets",
+                 "fuse_ld", "split_debug", "variant", "pgo_args", "pgo_input",
+                 "bench", "bench_warmup", "bench_output", "profile_run")
+
+class BuildServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Long-running build daemon on a localhost port.
+
+    It keeps one CmpileBuilder per project (working directory and compiler
+    profile), so the toolchain state, include scanner, header index and
+    package checks stay warm between builds, and it owns one compile pool
+    shared by all builds. Builds of the same out/ directory are serialized;
+    builds of different projects run in parallel.
+
+    The port and a random token are written to SERVER_INFO_PATH; clients
+    must send the token with every request.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, log_func, port=0, jobs=None):
+        super().__init__(("127.0.0.1", port), BuildRequestHandler)
+        self.log_func = log_func
+        self.token = secrets.token_hex(16)
+        # The server's own startup is not part of any build's profile
+        startup_profile.take()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+        self.builders = {}
+        self.locks = {}
+        self.registry_lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def builder_for(self, working_dir, profile, use_cache):
+        key = (working_dir, json.dumps(profile or {}, sort_keys=True), use_cache)
+        with self.registry_lock:
+            builder = self.builders.get(key)
+            if builder is None:
+                builder = cmpile.CmpileBuilder(profile=profile, use_cache=use_cache,
+                                               working_dir=working_dir, executor=self.executor)
+                self.builders[key] = builder
+            return builder
+
+    def refresh_tools(self):
+        """
+        Drops the process-wide tool caches (tool identities and the probed
+        toolchain) when a compiler or linker changed on disk since it was
+        looked at, so builds after a toolchain upgrade don't reuse the old
+        identity or capabilities. Costs a few stats per build.
+        """
+        with self.registry_lock:
+            if build_state.tool_identities_changed() or cmpile.get_toolchain().changed():
+                build_state.forget_tool_identities()
+                toolchain.forget_session()
+                return True
+        return False
+
+    def lock_for(self, out_dir):
+        with self.registry_lock:
+            return self.locks.setdefault(out_dir, threading.Lock())
+
+    def write_info(self):
+        os.makedirs(os.path.dirname(SERVER_INFO_PATH), exist_ok=True)
+        with open(SERVER_INFO_PATH, 'w', encoding='utf-8') as f:
+            json.dump({"port": self.port, "token": self.token, "pid": os.getpid()}, f)
+
+    def remove_info(self):
+        try:
+            with open(SERVER_INFO_PATH, 'r', encoding='utf-8') as f:
+                if json.load(f).get("token") != self.token:
+                    return
+            os.remove(SERVER_INFO_PATH)
+        except (OSError, ValueError):
+            pass
+
+    def serve(self):
+        self.write_info()
+        self.log_func(f"Build server listening on 127.0.0.1:{self.port}")
+        try:
+            self.serve_forever()
+        finally:
+            self.remove_info()
+            self.executor.shutdown()
+            self.server_close()
+
+class BuildRequestHandler(socketserver.StreamRequestHandler):
+    """Handles one JSON request per connection and streams JSON-line replies."""
+
+    def send(self, message):
+        if self.disconnected:
+            return
+        try:
+            self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        except OSError:
+            # The client went away; the build still finishes so its state stays consistent
+            self.disconnected = True
+
+    def handle(self):
+        self.disconnected = False
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+        except ValueError:
+            self.send({"type": "error", "message": "Malformed request."})
+            return
+        if request.get("token") != self.server.token:
+            self.send({"type": "error", "message": "Invalid token."})
+            return
+
+        kind = request.get("type")
+        if kind == "ping":
+            self.send({"type": "pong"})
+        elif kind == "shutdown":
+            self.send({"type": "result", "ok": True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif kind == "build":
+            self.handle_build(request)
+        else:
+            self.send({"type": "error", "message": f"Unknown request type: {kind}"})
+
+    def handle_build(self, request):
+        builder = self.server.builder_for(request["working_dir"], request.get("profile"),
+                                          request.get("use_cache", True))
+        options = {k: v for k, v in request.get("options", {}).items() if k in BUILD_OPTIONS}
+
+        lock = self.server.lock_for(builder.out_dir)
+        if not lock.acquire(blocking=False):
+            self.send({"type": "log", "message": f"Waiting for another build of {builder.out_dir}...", "style": ""})
+            lock.acquire()
+        try:
+            self.server.log_func(f"Building {len(request['files'])} file(s) in {builder.working_dir}")
+            if self.server.refresh_tools():
+                self.server.log_func("The toolchain changed on disk; probing it again.")
+            builder.profile_startup = bool(request.get("startup_profile"))
+            builder.log_callback = lambda message, style="": self.send({"type": "log", "message": message, "style": style})
+            try:
+                ok = builder.build_and_run(request["files"], **options)
+            except Exception as e:
+                self.send({"type": "log", "message": f"A critical error occurred: {e}", "style": "bold red"})
+                ok = False
+            finally:
+                builder.log_callback = None
+        finally:
+            lock.release()
+        self.send({"type": "result", "ok": bool(ok)})
+
+def read_server_info():
+    try:
+        with open(SERVER_INFO_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _request(message, on_message=None, connect_timeout=1.0):
+    """
+    Sends one request to the running server and returns its final reply.
+    Intermediate messages go to on_message. Returns None when no server is
+    reachable.
+    """
+    info = read_server_info()
+    if not info:
+        return None
+    try:
+        sock = socket.create_connection(("127.0.0.1", info["port"]), timeout=connect_timeout)
+    except OSError:
+        return None
+    with sock:
+        # Builds can take a long time; only the connect is bounded
+        sock.settimeout(None)
+        message = dict(message, token=info.get("token"))
+        sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        with sock.makefile('r', encoding='utf-8') as replies:
+            for line in replies:
+                reply = json.loads(line)
+                if reply.get("type") in ("result", "pong", "error"):
+                    return reply
+                if on_message:
+                    on_message(reply)
+    return None
+
+def is_running():
+    reply = _request({"type": "ping"})
+    return bool(reply and reply.get("type") == "pong")
+
+def stop_server():
+    reply = _request({"type": "shutdown"})
+    return bool(reply and reply.get("ok"))
+
+def request_build(files, log_func, working_dir=None, profile=None, use_cache=True, startup_profile=False, **options):
+    """
+    Runs a build on the server and streams its log to log_func; with
+    startup_profile the server reports the build's phase timings.
+    Returns True/False for the build result, or None when no server is
+    running (the caller should then build in-process).
+    """
+    working_dir = os.path.abspath(working_dir or os.getcwd())
+    message = {
+        "type": "build",
+        "working_dir": working_dir,
+        "files": [os.path.join(working_dir, f) for f in files],
+        "profile": profile,
+        "use_cache": use_cache,
+        "startup_profile": startup_profile,
+        "options": options,
+    }
+    try:
+        reply = _request(message, lambda m: log_func(m.get("message", ""), m.get("style", "")))
+    except (OSError, ValueError) as e:
+        log_func(f"Lost connection to the build server: {e}", "bold red")
+        return False
+    if reply is None:
+        return None
+    if reply.get("type") == "error":
+        log_func(f"Build server error: {reply.get('message')}", "bold red")
+        return False
+    return bool(reply.get("ok"))
@@ -0,0 +1,258 @@
+import os
+import json
+import shutil
+import hashlib
+
+STATE_FILE = "build_state.json"
+STATE_VERSION = 2
+
+# Sources compiled as C++ (everything else that isn't .c is left alone)
+CPP_EXTENSIONS = ('.cpp', '.cxx', '.cc')
+
+def object_path_for(src, out_dir):
+    """
+    Returns the object path for a source file.
+    The name is derived from the full source path, so a/util.cpp and
+    b/util.cpp get different objects instead of both writing out/util.o.
+    """
+    src = os.path.abspath(src)
+    base = os.path.splitext(os.path.basename(src))[0]
+    digest = hashlib.sha1(os.path.normcase(src).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(out_dir, f"{base}-{digest}.o")
+
+def write_if_changed(path, text):
+    """
+    Rewrites a generated file only when its content differs, so its mtime
+    stays stable and nothing that includes it is rebuilt for no reason.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                return
+    except OSError:
+        pass
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def depfile_path_for(obj_path):
+    return os.path.splitext(obj_path)[0] + ".d"
+
+def parse_depfile(path):
+    """
+    Parses a Makefile-style dependency file written by -MMD -MF.
+    Returns the list of prerequisites (source first, then headers),
+    or None if the file is missing or unreadable.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+    except OSError:
+        return None
+
+    text = text.replace("\\\r\n", " ").replace("\\\n", " ")
+
+    # Drop the "target:" part. The separator is a colon followed by
+    # whitespace, which keeps Windows drive letters like C:\ intact.
+    for i in range(len(text) - 1):
+        if text[i] == ':' and text[i + 1] in " \t\r\n":
+            text = text[i + 1:]
+            break
+    else:
+        return None
+
+    deps = []
+    current = []
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == '\\' and i + 1 < len(text) and text[i + 1] in " #":
+            # Escaped space or hash inside a path
+            current.append(text[i + 1])
+            i += 2
+            continue
+        if c == '$' and i + 1 < len(text) and text[i + 1] == '$':
+            current.append('$')
+            i += 2
+            continue
+        if c.isspace():
+            if current:
+                deps.append("".join(current))
+                current = []
+        else:
+            current.append(c)
+        i += 1
+    if current:
+        deps.append("".join(current))
+    return deps
+
+_identity_cache = {}
+
+def tool_identity(tool):
+    """
+    Returns a string identifying a compiler/linker binary without running it:
+    its resolved path, size and modification time. Upgrading or swapping the
+    toolchain changes the identity and invalidates everything it built.
+    """
+    if tool in _identity_cache:
+        return _identity_cache[tool]
+    identity = _read_identity(tool)
+    _identity_cache[tool] = identity
+    return identity
+
+def _read_identity(tool):
+    path = shutil.which(tool) or tool
+    try:
+        st = os.stat(path)
+        return f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    except OSError:
+        return tool
+
+def tool_identities_changed():
+    """True when a tool seen by tool_identity() was replaced or moved since."""
+    return any(_read_identity(tool) != identity for tool, identity in list(_identity_cache.items()))
+
+def forget_tool_identities():
+    _identity_cache.clear()
+
+def hash_file(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class BuildState:
+    """
+    Persistent build manifest for one output directory.
+    For every object and linked executable it records the exact command,
+    the identity of the tool that ran it and a (size, mtime, sha1) entry for
+    each input. Inputs whose size and mtime are unchanged are trusted without
+    rehashing, so a no-op build only stats files.
+    """
+    def __init__(self, out_dir, base_dir=None):
+        self.out_dir = out_dir
+        # Relative paths in depfiles are relative to the compiler's cwd
+        self.base_dir = base_dir
+        self.path = os.path.join(out_dir, STATE_FILE)
+        self.objects = {}
+        self.links = {}
+        self._hashes = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != STATE_VERSION:
+                raise ValueError("old build state format")
+            self.objects = data.get("objects", {})
+            self.links = data.get("links", {})
+        except (OSError, ValueError):
+            self.objects = {}
+            self.links = {}
+
+    def save(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": STATE_VERSION, "objects": self.objects, "links": self.links}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _fingerprint(self, path):
+        """Returns [size, mtime_ns, sha1] for path, hashing each file at most once per stat."""
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        digest = self._hashes.get(key)
+        if digest is None:
+            digest = hash_file(path)
+            self._hashes[key] = digest
+        return [st.st_size, st.st_mtime_ns, digest]
+
+    def _inputs_changed(self, inputs):
+        """Returns the first input that changed since it was recorded, else None."""
+        for path, (size, mtime_ns, digest) in inputs.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return path
+            if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                continue
+            # Touched but maybe not edited: only a content change counts
+            if self._fingerprint(path)[2] != digest:
+                return path
+            inputs[path] = [st.st_size, st.st_mtime_ns, digest]
+        return None
+
+    def _check(self, entry, output, cmd, tool):
+        if not os.path.exists(output):
+            return "no output"
+        if entry is None:
+            return "no build record"
+        if entry.get("command") != list(cmd):
+            return "command line changed"
+        if entry.get("tool") != tool_identity(tool):
+            return "toolchain changed"
+        if not entry.get("inputs"):
+            return "no recorded inputs"
+        changed = self._inputs_changed(entry["inputs"])
+        if changed:
+            return f"{os.path.basename(changed)} changed"
+        return None
+
+    def needs_rebuild(self, obj_path, cmd):
+        """
+        Returns a short reason string if obj_path must be rebuilt, else None.
+        An object is rebuilt when it is missing, when its command line or
+        compiler changed, or when the source or any header listed in its
+        depfile changed content.
+        """
+        entry = self.objects.get(os.path.abspath(obj_path))
+        return self._check(entry, obj_path, cmd, cmd[0])
+
+    def record(self, obj_path, cmd, extra_inputs=()):
+        """
+        Records a successful compile, taking its inputs from the depfile.
+        extra_inputs lists files the depfile does not mention, such as a
+        precompiled header.
+        """
+        deps = parse_depfile(depfile_path_for(obj_path)) or []
+        inputs = {}
+        for dep in list(deps) + list(extra_inputs):
+            if self.base_dir:
+                dep = os.path.join(self.base_dir, dep)
+            try:
+                inputs[dep] = self._fingerprint(dep)
+            except OSError:
+                pass
+        self.objects[os.path.abspath(obj_path)] = {
+            "command": list(cmd),
+            "tool": tool_identity(cmd[0]),
+            "inputs": inputs,
+        }
+
+    def forget(self, obj_path):
+        self.objects.pop(os.path.abspath(obj_path), None)
+
+    def needs_relink(self, exe_path, cmd):
+        """Like needs_rebuild, for a linked executable whose inputs are its objects."""
+        entry = self.links.get(os.path.abspath(exe_path))
+        return self._check(entry, exe_path, cmd, cmd[0])
+
+    def record_link(self, exe_path, cmd, object_files, seconds=None):
+        """Records a successful link; `seconds` is how long it took, shown next time it relinks."""
+        inputs = {}
+        for obj in object_files:
+            inputs[obj] = self._fingerprint(obj)
+        self.links[os.path.abspath(exe_path)] = {
+            "command": list(cmd),
+            "tool": tool_identity(cmd[0]),
+            "inputs": inputs,
+            "seconds": seconds,
+        }
+
+    def last_link_seconds(self, exe_path):
+        entry = self.links.get(os.path.abspath(exe_path))
+        return entry.get("seconds") if entry else None
+
+    def forget_link(self, exe_path):
+        self.links.pop(os.path.abspath(exe_path), None)
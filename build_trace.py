@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    # Windows: no rusage, so CPU times are reported as unknown
+    resource = None
+
+def children_cpu_time():
+    """CPU seconds used so far by all reaped child processes, or None if unknown."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def _windows_usage(proc):
+    """(cpu_seconds, peak_working_set_kb) of a finished process on Windows."""
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        kernel32 = ctypes.windll.kernel32
+        handle = wintypes.HANDLE(int(proc._handle))
+        creation, exit_time, kernel, user = (wintypes.FILETIME() for _ in range(4))
+        if not kernel32.GetProcessTimes(handle, ctypes.byref(creation), ctypes.byref(exit_time),
+                                        ctypes.byref(kernel), ctypes.byref(user)):
+            return None, None
+        # FILETIMEs count 100 ns units
+        seconds = lambda ft: ((ft.dwHighDateTime << 32) | ft.dwLowDateTime) / 1e7
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        peak = None
+        if kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            peak = counters.PeakWorkingSetSize // 1024
+        return seconds(kernel) + seconds(user), peak
+    except (OSError, AttributeError, ValueError, TypeError):
+        return None, None
+
+# How often the memory of a running program is sampled on Linux
+RSS_SAMPLE_INTERVAL = 0.01
+
+def _status_kb(pid, field):
+    """A "<field>: N kB" value from /proc/<pid>/status, or None."""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class _PeakRssSampler:
+    """
+    Polls a running process's VmHWM (its own high-water mark). Samples
+    taken before the process has exec'd still show our interpreter, so
+    they are skipped.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak = None
+        self._stop = threading.Event()
+        try:
+            self._own_exe = os.readlink("/proc/self/exe")
+        except OSError:
+            self._own_exe = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        try:
+            if os.readlink(f"/proc/{self.pid}/exe") == self._own_exe:
+                return
+        except OSError:
+            return
+        hwm = _status_kb(self.pid, "VmHWM")
+        if hwm is not None:
+            self.peak = max(self.peak or 0, hwm)
+
+    def _run(self):
+        while True:
+            self._sample()
+            if self._stop.wait(RSS_SAMPLE_INTERVAL):
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+def wait_with_usage(proc, measure_memory=True):
+    """
+    Waits for a Popen and returns (cpu_seconds, peak_rss_kb) of that one
+    process, using wait4 where available (the process handle on Windows).
+    Values are None when the platform cannot tell.
+
+    On Linux ru_maxrss is at least the RSS of the process that forked the
+    child (the kernel carries it across exec), so it only counts when it
+    exceeds our own high-water mark; otherwise the program's VmHWM as
+    last sampled while it ran is used.
+    """
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        if os.name == "nt":
+            cpu, peak = _windows_usage(proc)
+            return cpu, peak if measure_memory else None
+        return None, None
+    linux = sys.platform.startswith("linux")
+    sampler = _PeakRssSampler(proc.pid) if measure_memory and linux else None
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # Already reaped elsewhere
+        proc.wait()
+        usage = None
+    finally:
+        sampled = sampler.stop() if sampler else None
+    if usage is None:
+        return None, sampled
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    cpu = usage.ru_utime + usage.ru_stime
+    if not measure_memory:
+        return cpu, None
+    if sys.platform == "darwin":
+        return cpu, usage.ru_maxrss // 1024
+    if linux:
+        inherited = _status_kb("self", "VmHWM")
+        if inherited is None or usage.ru_maxrss <= inherited:
+            return cpu, sampled
+    return cpu, usage.ru_maxrss
+
+def run_process(cmd, cwd=None):
+    """Runs cmd and returns (returncode, stderr, cpu_seconds); stdout is discarded."""
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, encoding='utf-8', errors='replace')
+    with proc.stderr:
+        stderr = proc.stderr.read()
+    cpu, _ = wait_with_usage(proc, measure_memory=False)
+    return proc.returncode, stderr, cpu
+
+def _format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f} ms"
+
+class Tracer:
+    """
+    Collects timed spans for one build: a span per phase, opened with
+    phase() and closed by the next phase() or end_phase(), plus spans added
+    by workers (one per compiled TU).
+
+    Each span has its wall time and the CPU time of the subprocesses it ran.
+    Phase CPU is measured from the children totals of this process, so it is
+    approximate while other builds run in the same process (build server).
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._phase = None
+
+    def _thread_id(self):
+        ident = threading.get_ident()
+        with self._lock:
+            return self._threads.setdefault(ident, len(self._threads) + 1)
+
+    def add(self, name, category, start, wall, cpu=None, **args):
+        """Records a finished span; start is a time.perf_counter() value."""
+        event = {"name": name, "cat": category, "start": start - self.origin, "wall": wall,
+                 "cpu": cpu, "tid": self._thread_id(), "args": args}
+        with self._lock:
+            self.events.append(event)
+
+    def phase(self, name):
+        self.end_phase()
+        self._phase = (name, time.perf_counter(), children_cpu_time())
+
+    def end_phase(self):
+        if self._phase is None:
+            return
+        name, start, cpu_start = self._phase
+        self._phase = None
+        cpu_end = children_cpu_time()
+        cpu = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+        self.add(name, "phase", start, time.perf_counter() - start, cpu)
+
+    def save(self, path):
+        """Writes the spans in Chrome's trace-event format (chrome://tracing, Perfetto)."""
+        events = []
+        for event in self.events:
+            args = dict(event["args"])
+            if event["cpu"] is not None:
+                args["cpu_ms"] = round(event["cpu"] * 1000, 3)
+            events.append({"name": event["name"], "cat": event["cat"], "ph": "X",
+                           "ts": round(event["start"] * 1e6), "dur": round(event["wall"] * 1e6),
+                           "pid": os.getpid(), "tid": event["tid"], "args": args})
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp_path, path)
+
+    def summary(self, log_func, slowest=3):
+        """Logs a table of the phases, plus the slowest compiles."""
+        phases = [e for e in self.events if e["cat"] == "phase"]
+        if not phases:
+            return
+        compiles = sorted((e for e in self.events if e["cat"] == "compile"), key=lambda e: e["wall"], reverse=True)
+        width = max(len(e["name"]) for e in phases + [{"name": "total"}])
+        log_func("Build summary:")
+        log_func(f"  {'phase':<{width}}  {'wall':>11}  {'cpu':>11}")
+        for e in phases:
+            log_func(f"  {e['name']:<{width}}  {_format_ms(e['wall']):>11}  {_format_ms(e['cpu']):>11}")
+        cpu_values = [e["cpu"] for e in phases if e["cpu"] is not None]
+        log_func(f"  {'total':<{width}}  {_format_ms(sum(e['wall'] for e in phases)):>11}  "
+                 f"{_format_ms(sum(cpu_values) if cpu_values else None):>11}")
+        if compiles:
+            cached = sum(1 for e in compiles if e["args"].get("cached"))
+            slow = ", ".join(f"{e['name']} {_format_ms(e['wall'])}" for e in compiles[:slowest])
+            log_func(f"  {len(compiles)} TU(s), {cached} restored from cache; slowest: {slow}")
+        links = [e for e in self.events if e["cat"] == "link"]
+        if links:
+            parts = []
+            for e in links:
+                if e["args"].get("skipped"):
+                    parts.append(f"{e['name']} up to date")
+                    continue
+                text = f"{e['name']} {_format_ms(e['wall'])}"
+                if e["args"].get("previous") is not None:
+                    text += f" (was {_format_ms(e['args']['previous'])})"
+                if e["args"].get("fuse_ld"):
+                    text += f" [{e['args']['fuse_ld']}]"
+                parts.append(text)
+            log_func(f"  links: {', '.join(parts)}")
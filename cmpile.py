@@ -1,13 +1,33 @@
+import startup_profile
 import os
 import sys
-import subprocess
+import json
 import shlex
+import shutil
+import subprocess
+import time
+import threading
+import concurrent.futures
+startup_profile.mark("import stdlib")
 
 # Import our modules
 import ui
 import download_script
 import vcpkg_automation
 import package_finder
+import build_state
+import object_cache
+import pch
+import unity_build
+import watcher
+import build_trace
+import program_runner
+import toolchain
+import project
+import variants
+import program_bench
+import profiling
+startup_profile.mark("import cmpile modules")
 
 # Constants
 INTERNAL_DOWNLOADS = download_script.INTERNAL_DOWNLOADS
@@ -16,76 +36,259 @@ GPP_EXE = os.path.join(GCC_BIN, "clang++.exe")
 GCC_EXE = os.path.join(GCC_BIN, "clang.exe")
 
 GIT_CMD = os.path.join(download_script.INTERNAL_DOWNLOADS, "git", "cmd")
+GIT_EXE = os.path.join(GIT_CMD, "git.exe")
+VCPKG_EXE = os.path.join(download_script.VCPKG_DIR, "vcpkg.exe")
+TOOLCHAIN_STAMP_PATH = os.path.join(INTERNAL_DOWNLOADS, "toolchain_stamp.json")
+OBJECT_CACHE_DIR = os.path.join(INTERNAL_DOWNLOADS, "object_cache")
+SCAN_CACHE_FILE = "scan_cache.json"
+HEADER_INDEX_PATH = os.path.join(INTERNAL_DOWNLOADS, "header_index.json")
+TOOLCHAIN_PROBE_PATH = os.path.join(INTERNAL_DOWNLOADS, "toolchain_probe.json")
+
+# Provisioning steps run in parallel and each prepends to PATH
+_path_lock = threading.Lock()
 
 def setup_git_env():
     """Adds local git to PATH if present."""
     if os.path.exists(GIT_CMD):
-        if GIT_CMD not in os.environ["PATH"]:
-            os.environ["PATH"] = GIT_CMD + os.pathsep + os.environ["PATH"]
-            return True
+        with _path_lock:
+            if GIT_CMD not in os.environ["PATH"]:
+                os.environ["PATH"] = GIT_CMD + os.pathsep + os.environ["PATH"]
+                return True
     return False
 
-def ensure_environment(log_func):
-    """Checks and sets up GCC, Git and vcpkg."""
+def setup_gcc_env():
+    """Adds the bundled compiler to PATH so vcpkg/cmake can find it."""
+    with _path_lock:
+        if GCC_BIN not in os.environ["PATH"]:
+            os.environ["PATH"] = GCC_BIN + os.pathsep + os.environ["PATH"]
+
+def resolve_tool(bundled, *names):
+    """
+    The executable used for a tool on this platform: the bundled one
+    (without .exe outside Windows), else the first of `names` on PATH.
+    """
+    candidates = [bundled] if os.name == "nt" else [os.path.splitext(bundled)[0], bundled]
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    for name in names:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+def toolchain_fingerprint():
+    """
+    Identifies the provisioned toolchain without running anything: the
+    path, size and mtime of git, the compiler and vcpkg, plus the pinned
+    download versions. Returns None while any of the tools is missing.
+    """
+    fingerprint = {"gcc_url": download_script.GCC_URL, "git_url": download_script.GIT_URL}
+    tools = (("git", resolve_tool(GIT_EXE, "git")),
+             ("compiler", resolve_tool(GPP_EXE, "clang++", "g++")),
+             ("vcpkg", resolve_tool(VCPKG_EXE, "vcpkg")))
+    for name, path in tools:
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        fingerprint[name] = [path, st.st_size, st.st_mtime_ns]
+    return fingerprint
+
+def toolchain_is_validated():
+    """True when the stamp written after the last full check still matches the tools on disk."""
+    fingerprint = toolchain_fingerprint()
+    if fingerprint is None:
+        return False
+    try:
+        with open(TOOLCHAIN_STAMP_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f) == fingerprint
+    except (OSError, ValueError):
+        return False
+
+def write_toolchain_stamp():
+    fingerprint = toolchain_fingerprint()
+    if fingerprint is None:
+        return
+    try:
+        with open(TOOLCHAIN_STAMP_PATH, 'w', encoding='utf-8') as f:
+            json.dump(fingerprint, f)
+    except OSError:
+        pass
+
+def run_step_graph(steps, log_func):
+    """
+    Runs provisioning steps concurrently, each as soon as the steps it
+    depends on have finished. `steps` maps a name to (func, deps); func
+    gets a log function that prefixes messages with the step name.
+    Steps whose dependencies failed are skipped. Raises the first error
+    once every runnable step has finished.
+    """
+    def run(name, func):
+        start = time.perf_counter()
+        func(lambda message, style="": log_func(f"[{name}] {message}", style))
+        return time.perf_counter() - start
+
+    done = set()
+    failed = {}
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(steps) or 1) as pool:
+        while True:
+            for name, (func, deps) in steps.items():
+                if name in done or name in failed or name in running.values():
+                    continue
+                if any(dep in failed for dep in deps):
+                    failed[name] = None
+                    log_func(f"[{name}] skipped: a step it depends on failed", "bold red")
+                elif all(dep in done for dep in deps):
+                    running[pool.submit(run, name, func)] = name
+            if not running:
+                break
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    log_func(f"[{name}] done in {future.result():.1f}s")
+                    done.add(name)
+                except Exception as e:
+                    failed[name] = e
+
+    errors = [e for e in failed.values() if e is not None]
+    if errors:
+        raise errors[0]
+
+def ensure_environment(log_func, force=False):
+    """
+    Checks and sets up GCC, Git and vcpkg.
+    When the toolchain stamp matches the tools on disk, the provisioning
+    checks are skipped and only PATH is set up; `force` always re-checks
+    (and repairs damaged downloads).
+
+    Git and the compiler are provisioned in parallel; only the vcpkg clone
+    waits for git.
+    """
+    if not force and toolchain_is_validated():
+        setup_git_env()
+        setup_gcc_env()
+        return vcpkg_automation.VcpkgManager(INTERNAL_DOWNLOADS, log_func=log_func)
+
     log_func("Checking environment...")
+    start = time.perf_counter()
+    vcpkg_mgr = vcpkg_automation.VcpkgManager(INTERNAL_DOWNLOADS, log_func=log_func)
 
-    # Check/Install Git first
-    download_script.install_git(log_func=log_func)
-    setup_git_env()
+    def provision_git(step_log):
+        download_script.install_git(log_func=step_log, verify=force)
+        setup_git_env()
 
-    # Check GCC
-    if not os.path.exists(GPP_EXE):
-        log_func("GCC not found. installing...")
+    def provision_compiler(step_log):
+        if not os.path.exists(GPP_EXE):
+            step_log("GCC not found. installing...")
         try:
-            download_script.install_gcc(log_func=log_func)
+            download_script.install_gcc(log_func=step_log, verify=force)
         except Exception as e:
-            log_func(f"Failed to install GCC: {e}", "bold red")
+            step_log(f"Failed to install GCC: {e}", "bold red")
             raise e
+        setup_gcc_env()
 
-    # Add GCC to PATH so vcpkg/cmake can find it
-    if GCC_BIN not in os.environ["PATH"]:
-        os.environ["PATH"] = GCC_BIN + os.pathsep + os.environ["PATH"]
-
-    # Check vcpkg
-    vcpkg_mgr = vcpkg_automation.VcpkgManager(INTERNAL_DOWNLOADS, log_func=log_func)
-    if not vcpkg_mgr.is_installed():
-        log_func("vcpkg not found. installing...")
+    def provision_vcpkg(step_log):
+        if vcpkg_mgr.is_installed():
+            return
+        step_log("vcpkg not found. installing...")
         try:
-            download_script.install_vcpkg(git_path_env=GIT_CMD, log_func=log_func)
+            download_script.install_vcpkg(git_path_env=GIT_CMD, log_func=step_log)
         except Exception as e:
-            log_func(f"Failed to install vcpkg: {e}", "bold red")
+            step_log(f"Failed to install vcpkg: {e}", "bold red")
             raise e
 
+    run_step_graph({
+        "git": (provision_git, []),
+        "compiler": (provision_compiler, []),
+        "vcpkg": (provision_vcpkg, ["git"]),
+    }, log_func)
+
+    write_toolchain_stamp()
+    log_func(f"Environment ready in {time.perf_counter() - start:.1f}s")
     return vcpkg_mgr
 
+def get_toolchain():
+    """The tools on the current PATH, probed once per session (see toolchain.Toolchain)."""
+    return toolchain.get_toolchain(TOOLCHAIN_PROBE_PATH)
+
+def find_tool_path(*names):
+    """Full path of the first of the given tools the toolchain found, or None."""
+    tools = get_toolchain()
+    name = tools.find(*names)
+    return tools.path(name) if name else None
+
 def get_compiler_for_file(filepath, profile={}):
     """Returns the appropriate compiler executable."""
     if filepath.endswith(('.c', '.C')):
-<<<<<<< HEAD
-<<<<<<< HEAD
-        return profile.get("c_compiler") or (
-            "clang" if download_script.is_tool_on_path("clang") else
-            "gcc" if download_script.is_tool_on_path("gcc") else
-            GCC_EXE
-        )
-    return profile.get("cpp_compiler") or (
-        "clang++" if download_script.is_tool_on_path("clang++") else
-        "g++" if download_script.is_tool_on_path("g++") else
-        GPP_EXE
-    )
-        if download_script.is_tool_on_path("clang"): return "clang"
-        if download_script.is_tool_on_path("gcc"): return "gcc"
-=======
->>>>>>> parent of c3ecbf0 (Version 2,1 is here (may contain bugs))
-=======
->>>>>>> parent of c3ecbf0 (Version 2,1 is here (may contain bugs))
-        return GCC_EXE
-    return GPP_EXE
+        return profile.get("c_compiler") or find_tool_path("clang", "gcc") or GCC_EXE
+    return profile.get("cpp_compiler") or find_tool_path("clang++", "g++") or GPP_EXE
+
+def split_flags(compiler_flags):
+    """Splits a user-supplied flag string the way a shell would."""
+    if not compiler_flags:
+        return []
+    try:
+        return shlex.split(compiler_flags)
+    except ValueError:
+        return compiler_flags.split()
+
+def include_dirs_from_flags(flags):
+    """Returns the directories named by -I options in a flag list."""
+    dirs = []
+    for i, flag in enumerate(flags):
+        if flag == "-I" and i + 1 < len(flags):
+            dirs.append(flags[i + 1])
+        elif flag.startswith("-I") and len(flag) > 2:
+            dirs.append(flag[2:])
+    return dirs
+
+def _run_compile(cmd, cwd=None):
+    """Runs one compiler invocation and returns (returncode, stderr, cpu_seconds)."""
+    try:
+        return build_trace.run_process(cmd, cwd=cwd)
+    except OSError as e:
+        return 1, f"Failed to start {cmd[0]}: {e}", None
+
+def _run_output(cmd, cwd=None):
+    """Runs a reporting tool and returns (returncode, stdout, stderr)."""
+    try:
+        result = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    except OSError as e:
+        return 1, "", f"Failed to start {cmd[0]}: {e}"
+    return result.returncode, result.stdout, result.stderr
 
 class CmpileBuilder:
-    def __init__(self, log_callback=None, profile=None):
+    def __init__(self, log_callback=None, profile=None, use_cache=True, profile_startup=False,
+                 working_dir=None, executor=None):
         self.log_callback = log_callback
         self.profile = profile or {}
+        self.profile_startup = profile_startup
+        # Phase timings of the current build when profile_startup is set
+        self._startup = None
+        # Relative source paths, flags and out/ are resolved against working_dir
+        # rather than the process cwd, so one process can build several projects
+        self.working_dir = os.path.abspath(working_dir or os.getcwd())
+        self.out_dir = os.path.join(self.working_dir, "out")
+        # Shared compile pool (build server); otherwise each build makes its own
+        self.executor = executor
+        self.object_cache = object_cache.ObjectCache(OBJECT_CACHE_DIR) if use_cache else None
+        # Include graph of the last build, {path: [package_finder.Include, ...]}
+        self.include_graph = {}
+        # Spans of the current (or last) build
+        self.tracer = build_trace.Tracer()
+        # Program produced by the last successful build, if it produced exactly one
+        self.last_executable = None
+
+        # Warm state reused by later builds with the same builder (watch mode)
+        self._vcpkg_mgr = None
+        self._scanner = None
+        self._header_index = None
+        self._installed_packages = set()
 
     def log(self, message, style=""):
         if self.log_callback:
@@ -99,191 +302,788 @@ class CmpileBuilder:
             else:
                 ui.display_status(message)
 
-    def build_and_run(self, source_files, compiler_flags=None, clean=False, run=True):
-        files = [os.path.abspath(f) for f in source_files]
+    def _source_path(self, path):
+        return os.path.normpath(os.path.join(self.working_dir, path))
+
+    def _mark(self, phase):
+        if self._startup:
+            self._startup.mark(phase)
+
+    def compile_sources(self, jobs_list, jobs=None, keep_going=False, diagnostics=None):
+        """
+        Compiles (src, obj_path, cmd) entries on a bounded worker pool.
+        Each TU's diagnostics are logged as one block once it finishes, so
+        output from concurrent compiles never interleaves. If a diagnostics
+        dict is given, the stderr of each failed source is stored in it.
+        Returns (succeeded, failed) lists of the entries passed in.
+        """
+        jobs = max(1, jobs or os.cpu_count() or 1)
+        succeeded = []
+        failed = []
+        if not jobs_list:
+            return succeeded, failed
+
+        pool = self.executor or concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        try:
+            futures = {}
+            for entry in jobs_list:
+                src, _, cmd = entry
+                self.log(f"Compiling {os.path.basename(src)}...")
+                futures[pool.submit(self._compile_one, *entry)] = entry
+
+            for future in concurrent.futures.as_completed(futures):
+                entry = futures[future]
+                returncode, stderr, cached = future.result()
+                if returncode == 0:
+                    succeeded.append(entry)
+                    if cached:
+                        self.log(f"Restored {os.path.basename(entry[0])} from cache")
+                    # Warnings still go to the log, but as one block per TU
+                    if stderr:
+                        self.log(stderr, "bold red")
+                    continue
+
+                failed.append(entry)
+                if diagnostics is not None:
+                    diagnostics[entry[0]] = stderr
+                self.log(f"Compilation failed for {entry[0]}.", "bold red")
+                if stderr:
+                    self.log(stderr, "bold red")
+                if not keep_going:
+                    # Drop queued TUs; the ones already running finish on their own
+                    for f in futures:
+                        f.cancel()
+                    break
+        finally:
+            if pool is not self.executor:
+                pool.shutdown()
+
+        if self.object_cache:
+            self.object_cache.flush()
+        return succeeded, failed
+
+    def _compile_one(self, src, obj_path, cmd):
+        """
+        Worker for compile_sources: consults the shared object cache before
+        running the compiler. Returns (returncode, stderr, from_cache).
+        """
+        start = time.perf_counter()
+        key = None
+        # The cache stores only the object, not the .dwo file split debug info needs,
+        # and PGO objects depend on profile data that isn't part of the key
+        if self.object_cache and "-gsplit-dwarf" not in cmd and not any(f.startswith("-fprofile-") for f in cmd):
+            key = self.object_cache.compute_key(cmd, src, obj_path, build_state.depfile_path_for(obj_path),
+                                                cwd=self.working_dir)
+            if key:
+                stderr = self.object_cache.fetch(key, obj_path)
+                if stderr is not None:
+                    self.tracer.add(os.path.basename(src), "compile", start, time.perf_counter() - start,
+                                    cached=True)
+                    return 0, stderr, True
+
+        returncode, stderr, cpu = _run_compile(cmd, cwd=self.working_dir)
+        if returncode == 0 and key:
+            self.object_cache.store(key, obj_path, stderr)
+        self.tracer.add(os.path.basename(src), "compile", start, time.perf_counter() - start, cpu,
+                        src=src, returncode=returncode)
+        return returncode, stderr, False
+
+    def watch(self, source_files, stop_event=None, **build_options):
+        """
+        Builds and runs, then rebuilds and reruns whenever one of the sources
+        or the project headers they include is saved. Warm state (toolchain,
+        include graph, packages) is kept on this builder between rounds, and
+        the build manifest limits each round to the affected TUs.
+        Runs until stop_event is set (or forever in the CLI).
+        """
+        file_watcher = watcher.FileWatcher()
+        if build_options.get("project_file"):
+            file_watcher.watch_paths([self._source_path(build_options["project_file"])])
+        try:
+            while True:
+                file_watcher.watch_paths(self._source_path(f) for f in source_files)
+                self.build_and_run(source_files, **build_options)
+                # Only the first round may be a clean build
+                build_options["clean"] = False
+
+                file_watcher.watch_paths(self.include_graph)
+                self.log(f"Watching {len(file_watcher.paths)} file(s) for changes ({file_watcher.backend})...")
+                changed = file_watcher.wait_for_change(stop_event)
+                if not changed:
+                    break
+                self.log(f"Changed: {', '.join(sorted(os.path.basename(p) for p in changed))}")
+        finally:
+            file_watcher.close()
+
+    def build_and_run(self, source_files, trace=None, **build_options):
+        """
+        Builds (and by default runs) the given sources; see _build_and_run
+        for the options. Every phase is traced and summarised at the end;
+        with `trace` the spans are also written there as a Chrome trace.
+        """
+        self.tracer = build_trace.Tracer()
+        self._startup = startup_profile.take() if self.profile_startup else None
+        try:
+            if build_options.pop("profile_run", False):
+                return self._build_profile_run(source_files, **build_options)
+            if build_options.get("variant") == "pgo":
+                return self._build_pgo(source_files, **build_options)
+            return self._build_and_run(source_files, **build_options)
+        finally:
+            self.tracer.end_phase()
+            self.tracer.summary(self.log)
+            if self._startup:
+                self._startup.report(self.log)
+            if trace:
+                trace_path = self._source_path(trace)
+                # Never replace something that isn't a trace, such as a source file
+                if os.path.exists(trace_path) and not trace_path.lower().endswith(".json"):
+                    self.log(f"Not writing the trace over {trace_path}; use a .json path.", "bold red")
+                else:
+                    try:
+                        self.tracer.save(trace_path)
+                        self.log(f"Trace written to {trace_path}")
+                    except OSError as e:
+                        self.log(f"Could not write trace: {e}", "bold red")
+
+    def _build_and_run(self, source_files, compiler_flags=None, clean=False, run=True, jobs=None, keep_going=False, use_pch=True, unity=None,
+                       run_timeout=None, memory_limit_mb=None, project_file=None, targets=None, fuse_ld=None,
+                       split_debug=False, variant=None, pgo_args=None, pgo_input=None, bench=None, bench_warmup=1,
+                       bench_output=None):
+        self.last_executable = None
+        # With a project file the sources come from its targets (or the named ones)
+        manifest = None
+        selected = []
+        if project_file:
+            try:
+                manifest = project.Project.load(self._source_path(project_file))
+                selected = manifest.ordered(targets)
+            except project.ProjectError as e:
+                self.log(str(e), "bold red")
+                return False
+            source_files = manifest.sources(selected)
+            compiler_flags = " ".join(f for f in (manifest.compiler_flags, compiler_flags) if f)
+            if unity is not None:
+                # Targets link individual objects, which unity groups don't provide
+                self.log("Unity builds are not used for project builds.")
+                unity = None
+            self.log(f"Project {os.path.basename(manifest.path)}: building {', '.join(t.name for t in selected)}")
+
+        files = [self._source_path(f) for f in source_files]
         for path in files:
             if not os.path.exists(path):
                 self.log(f"File not found: {path}", "bold red")
                 return False
 
         # 1. Environment Setup
-        try:
-            vcpkg_mgr = ensure_environment(self.log)
-        except Exception as e:
-            self.log(f"Environment setup failed: {e}", "bold red")
-            return False
+        self.tracer.phase("environment")
+        if self._vcpkg_mgr is None or clean:
+            try:
+                self._vcpkg_mgr = ensure_environment(self.log, force=clean)
+            except Exception as e:
+                self.log(f"Environment setup failed: {e}", "bold red")
+                return False
+        vcpkg_mgr = self._vcpkg_mgr
+        self._mark("environment check")
+
+        # Every variant has its own objects, state and executables
+        OUT_DIR = variants.output_dir(self.out_dir, variant)
+        if not os.path.exists(OUT_DIR):
+            os.makedirs(OUT_DIR)
+
+        user_flags = split_flags(compiler_flags)
 
         # 2. Dependency Analysis
-        all_includes = set()
-        for src in files:
-            self.log(f"Analyzing {os.path.basename(src)}...")
-            includes = package_finder.find_includes(src)
-            all_includes.update(includes)
+        self.tracer.phase("include scan")
+        self.log(f"Analyzing {len(files)} source file(s)...")
+        include_dirs = [self._source_path(d) for d in include_dirs_from_flags(user_flags)]
+        scanner = self._scanner
+        if scanner is None or scanner.include_dirs != include_dirs:
+            scanner = package_finder.IncludeScanner(os.path.join(OUT_DIR, SCAN_CACHE_FILE), include_dirs=include_dirs,
+                                                     log_func=self.log)
+            self._scanner = scanner
+        self.include_graph = scanner.scan(files)
+        scanner.save()
+        headers = len(self.include_graph) - len(set(files))
+        if headers > 0:
+            self.log(f"Followed includes through {headers} project header(s) ({scanner.rescanned} file(s) rescanned).")
 
-        required_packages = package_finder.map_includes_to_packages(all_includes)
+        self._mark("include scan")
+
+        self.tracer.phase("package resolution")
+        all_includes = package_finder.external_includes(self.include_graph)
+        if self._header_index is None:
+            self._header_index = package_finder.HeaderIndex.load(vcpkg_mgr.vcpkg_root, HEADER_INDEX_PATH)
+        else:
+            self._header_index.refresh()
+            self._header_index.save()
+        header_index = self._header_index
+        required_packages = package_finder.map_includes_to_packages(all_includes, header_index)
 
         if required_packages:
-            self.log(f"Identified dependencies: {', '.join(required_packages)}")
-            for pkg in required_packages:
-                 if not vcpkg_mgr.install_package(pkg):
-                     self.log(f"Failed to install dependency: {pkg}", "bold red")
-                     return False # Stop if dependency fails
+            self.log(f"Identified dependencies: {', '.join(sorted(required_packages))}")
+            if not required_packages <= self._installed_packages:
+                if not vcpkg_mgr.install_many(sorted(required_packages)):
+                    self.log("Failed to install dependencies.", "bold red")
+                    return False # Stop if dependency fails
+                self._installed_packages |= required_packages
         else:
             self.log("No external dependencies detected.")
+        self._mark("package resolution")
 
         # 3. Compilation
         self.log("Compiling...")
 
-        OUT_DIR = "out"
-        if not os.path.exists(OUT_DIR):
-            os.makedirs(OUT_DIR)
-
         object_files = []
 
         include_path = vcpkg_mgr.get_include_path()
         lib_path = vcpkg_mgr.get_lib_path()
 
+        try:
+            family = get_toolchain().family(get_compiler_for_file(files[0], self.profile))
+            variant_compile_flags, variant_link_flags = variants.flags(variant, family, OUT_DIR)
+        except ValueError as e:
+            self.log(str(e), "bold red")
+            return False
+        if variant:
+            self.log(f"Variant {variant}: {' '.join(variant_compile_flags) or 'no extra flags'}")
+
         base_compile_flags = []
         if os.path.exists(include_path):
             base_compile_flags.extend(["-I", include_path])
-        if compiler_flags:
-            try:
-                base_compile_flags.extend(shlex.split(compiler_flags))
-            except:
-                base_compile_flags.extend(compiler_flags.split())
-
-        compilation_failed = False
-        for src in files:
-            compiler = get_compiler_for_file(src, self.profile)
-            base_name = os.path.basename(src)
-            obj_name = os.path.splitext(base_name)[0] + ".o"
-            obj_path = os.path.join(OUT_DIR, obj_name)
-            object_files.append(obj_path)
-
-            needs_recompile = True
-            if os.path.exists(obj_path) and not clean:
-                if os.path.getmtime(src) < os.path.getmtime(obj_path):
-                    needs_recompile = False
-
-            if needs_recompile:
-                self.log(f"Compiling {base_name}...")
-                cmd = [compiler, "-c", src, "-o", obj_path] + base_compile_flags
-                try:
-                    # Capture stderr to show compile errors
-                    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-                    if result.stderr:
-                        self.log(result.stderr, "bold red")
-                except subprocess.CalledProcessError as e:
-                    self.log(f"Compilation failed for {src}.", "bold red")
-                    self.log(e.stderr, "bold red")
-                    compilation_failed = True
-                    break
+        # Before the user's flags, so those still win
+        base_compile_flags.extend(variant_compile_flags)
+        base_compile_flags.extend(user_flags)
+        if split_debug:
+            base_compile_flags.extend(self._split_debug_flags(files[0], user_flags))
+
+        state = build_state.BuildState(OUT_DIR, base_dir=self.working_dir)
+
+        # Precompile the heavy headers most C++ TUs share
+        pch_flags, pch_binary, no_pch = [], None, set()
+        cpp_files = [f for f in files if f.lower().endswith(build_state.CPP_EXTENSIONS)]
+        if use_pch and cpp_files:
+            self.tracer.phase("precompiled header")
+            pch_graph, pch_sources = self.include_graph, cpp_files
+            if manifest:
+                # Chosen from every target, so building a subset keeps the same PCH and objects
+                pch_sources = [f for f in manifest.sources(manifest.ordered()) if f.lower().endswith(build_state.CPP_EXTENSIONS)]
+                pch_graph = scanner.scan(pch_sources)
+                scanner.save()
+            shared_headers = pch.select_headers(pch_graph, pch_sources, header_index,
+                                                previous=None if clean else pch.current_headers(OUT_DIR))
+            pch_flags, pch_binary = pch.prepare(OUT_DIR, shared_headers, get_compiler_for_file(cpp_files[0], self.profile),
+                                                base_compile_flags, state, self.log, force=clean, cwd=self.working_dir)
+            if pch_binary:
+                # TUs that set a macro before including a PCH header are compiled without it
+                no_pch = {src for src in cpp_files if pch.defines_before_pch(pch_graph, scanner, src, shared_headers)}
+                if no_pch:
+                    self.log(f"Not using the precompiled header for {len(no_pch)} file(s) that #define before including its headers.")
+
+        def uses_pch(src):
+            if not pch_binary or not src.lower().endswith(build_state.CPP_EXTENSIONS):
+                return False
+            members = unity_plan.members.get(src, [src]) if unity_plan else [src]
+            return not any(member in no_pch for member in members)
+
+        def compile_entry(src):
+            obj_path = build_state.object_path_for(src, OUT_DIR)
+            dep_path = build_state.depfile_path_for(obj_path)
+            cmd = [get_compiler_for_file(src, self.profile), "-c", src, "-o", obj_path, "-MMD", "-MF", dep_path] + base_compile_flags
+            if uses_pch(src):
+                cmd += pch_flags
+            return src, obj_path, cmd
+
+        def record_results(succeeded, failed):
+            for src, obj_path, cmd in succeeded:
+                extra = [pch_binary] if uses_pch(src) else []
+                state.record(obj_path, cmd, extra)
+            for _, obj_path, _ in failed:
+                state.forget(obj_path)
+
+        self.tracer.phase("compile")
+        # Unity builds compile generated amalgamations instead of each file
+        unity_plan = None
+        compile_units = files
+        if unity is not None:
+            unity_plan = unity_build.UnityPlan(OUT_DIR, unity or jobs or os.cpu_count() or 1)
+            compile_units = unity_plan.prepare(files)
+            self.log(f"Unity build: {len(files)} file(s) in {len(compile_units)} compile unit(s).")
+
+        pending = []
+        for src in compile_units:
+            entry = compile_entry(src)
+            object_files.append(entry[1])
+            reason = "clean build" if clean else state.needs_rebuild(entry[1], entry[2])
+            if reason:
+                pending.append(entry)
             else:
-                 self.log(f"Skipping {base_name} (up to date)")
+                 self.log(f"Skipping {os.path.basename(src)} (up to date)")
+
+        # A failing unity group is retried file by file, so keep going past it
+        diagnostics = {}
+        succeeded, failed = self.compile_sources(pending, jobs=jobs, keep_going=keep_going or unity_plan is not None,
+                                                 diagnostics=diagnostics)
+        record_results(succeeded, failed)
+
+        if unity_plan:
+            still_failed = []
+            for group_entry in failed:
+                group_src = group_entry[0]
+                if not unity_plan.is_unity_file(group_src):
+                    still_failed.append(group_entry)
+                    continue
+                members = unity_plan.members[group_src]
+                self.log(f"Unity group {os.path.basename(group_src)} failed; compiling its {len(members)} files individually...")
+                member_entries = [compile_entry(src) for src in members]
+                member_ok, member_failed = self.compile_sources(member_entries, jobs=jobs, keep_going=True)
+                record_results(member_ok, member_failed)
+                object_files.remove(group_entry[1])
+                object_files.extend(entry[1] for entry in member_entries)
+                if member_failed:
+                    still_failed.extend(member_failed)
+                else:
+                    excluded = unity_plan.exclude(members, diagnostics.get(group_src, ""))
+                    self.log(f"Excluded from unity builds: {', '.join(os.path.basename(f) for f in excluded)}")
+            failed = still_failed
+        state.save()
 
-        if compilation_failed:
+        if failed:
+            if len(failed) > 1:
+                self.log(f"{len(failed)} files failed to compile: {', '.join(os.path.basename(f[0]) for f in failed)}", "bold red")
             return False
 
         # Link
-        self.log("Linking...")
-<<<<<<< HEAD
-<<<<<<< HEAD
+        self.tracer.phase("link")
 
-        cpp_in_use = any(f.lower().endswith(('.cpp', '.cxx', '.cc')) for f in files)
+        # Sorted so the link command (and thus the relink check) is stable between runs.
+        link_args = variant_link_flags + self._link_arguments(lib_path, required_packages)
+        lto = any(f.startswith("-flto") for f in variant_link_flags + user_flags)
 
-        linker = self.profile.get("linker")
-        if not linker:
-            if cpp_in_use:
-                if download_script.is_tool_on_path("clang++"): linker = "clang++"
-                elif download_script.is_tool_on_path("g++"): linker = "g++"
-                else: linker = GPP_EXE
-            else:
-                if download_script.is_tool_on_path("clang"): linker = "clang"
-                elif download_script.is_tool_on_path("gcc"): linker = "gcc"
-                else: linker = GCC_EXE
-        cpp_in_use = any(get_compiler_for_file(src) in [GPP_EXE, "g++", "clang++"] for src in files)
-        if cpp_in_use:
-            if download_script.is_tool_on_path("clang++"): linker = "clang++"
-            elif download_script.is_tool_on_path("g++"): linker = "g++"
-            else: linker = GPP_EXE
+        if manifest:
+            ok = self._link_targets(manifest, selected, link_args, state, clean, fuse_ld, OUT_DIR,
+                                    lto=lto, family=family)
+            state.save()
+            if not ok:
+                return False
+            self.log("Build successful!", "bold green")
+            executables = [t for t in selected if t.kind == "exe" and (not targets or t.name in targets)]
+            if run and len(executables) > 1:
+                self.log(f"Built {len(executables)} executables; name one with --target to run it.")
+            if len(executables) != 1:
+                return True
+            output_exe = os.path.join(OUT_DIR, executables[0].name + ".exe")
         else:
-            if download_script.is_tool_on_path("clang"): linker = "clang"
-            elif download_script.is_tool_on_path("gcc"): linker = "gcc"
-            else: linker = GCC_EXE
-=======
-=======
->>>>>>> parent of c3ecbf0 (Version 2,1 is here (may contain bugs))
-        linker = GCC_EXE
-        for src in files:
-            if get_compiler_for_file(src) == GPP_EXE:
-                linker = GPP_EXE
-                break
-<<<<<<< HEAD
->>>>>>> parent of c3ecbf0 (Version 2,1 is here (may contain bugs))
-=======
->>>>>>> parent of c3ecbf0 (Version 2,1 is here (may contain bugs))
+            exe_name = os.path.splitext(os.path.basename(files[0]))[0] + ".exe"
+            output_exe = os.path.join(OUT_DIR, exe_name)
+            linker = self._linker_for(files)
+            cmd = [linker] + self._fuse_ld_flags(linker, fuse_ld, lto) + object_files + ["-o", output_exe] + link_args
+            ok = self._link_output(output_exe, cmd, object_files, state, clean, self.log)
+            state.save()
+            if not ok:
+                return False
+            self.log("Build successful!", "bold green")
+        self.last_executable = output_exe
 
-        exe_name = os.path.splitext(os.path.basename(files[0]))[0] + ".exe"
-        output_exe = os.path.join(OUT_DIR, exe_name)
+        if run and bench:
+            self.tracer.phase("bench")
+            self._bench(output_exe, bench, bench_warmup, run_timeout, memory_limit_mb, bench_output)
+        elif run:
+            self.tracer.phase("run")
+            self.log("Running...", "bold")
 
-        cmd = [linker] + object_files + ["-o", output_exe]
-        if os.path.exists(lib_path):
-            cmd.extend(["-L", lib_path])
+            try:
+                result = program_runner.run_program([output_exe], self.log, cwd=self.working_dir, env=self._run_env(),
+                                                    timeout=run_timeout, memory_limit_mb=memory_limit_mb)
+                usage = program_runner.format_usage(result)
+                if result.timed_out:
+                    self.log(f"Execution stopped after the {run_timeout}s time limit ({usage})", "bold red")
+                elif result.returncode != 0:
+                    hint = f"; memory limit was {memory_limit_mb} MB" if memory_limit_mb else ""
+                    self.log(f"Execution finished with return code {result.returncode} ({usage}{hint})", "bold red")
+                else:
+                    self.log(f"Execution finished ({usage})")
 
-        # Add required libraries. This is a simplified approach.
-        # A more robust solution would involve checking vcpkg's installed files.
-        if required_packages:
-            for pkg in required_packages:
-                 if pkg == "nlohmann-json": continue
-                 if pkg == "fmt": cmd.append("-lfmt"); continue
-                 if pkg == "sqlite3": cmd.append("-lsqlite3"); continue
-                 if pkg == "curl": cmd.append("-lcurl"); continue
-                 cmd.append(f"-l{pkg}")
+            except Exception as e:
+                self.log(f"Execution error: {e}", "bold red")
+
+        return True
+
+    def _run_env(self):
+        """Environment for running built programs: vcpkg's DLLs come first on PATH."""
+        env = os.environ.copy()
+        bin_path = self._vcpkg_mgr.get_bin_path() if self._vcpkg_mgr else None
+        if bin_path and os.path.exists(bin_path):
+            env["PATH"] = bin_path + os.pathsep + env["PATH"]
+        return env
 
-        cmd.extend(["-static-libgcc", "-static-libstdc++"])
+    def _bench(self, exe, runs, warmup=1, timeout=None, memory_limit_mb=None, output=None):
+        """
+        Runs exe `warmup` times untimed, then `runs` times timed with stdout
+        discarded (or written to `output`), reports min/median/p95 wall time
+        and peak RSS, and compares them with the previous build of the same
+        program from the project's benchmark history.
+        """
+        stdout_path = self._source_path(output) if output else None
+        env = self._run_env()
+        if memory_limit_mb and not program_runner.memory_limit_supported():
+            self.log("Memory limits are not supported on this platform; running without one.", "bold red")
+        self.log(f"Benchmarking {os.path.basename(exe)}: {warmup} warm-up run(s), {runs} timed run(s)...", "bold")
 
+        results = []
+        for i in range(warmup + runs):
+            try:
+                result, stderr = program_runner.measure_program([exe], cwd=self.working_dir, env=env, timeout=timeout,
+                                                                memory_limit_mb=memory_limit_mb, stdout_path=stdout_path)
+            except Exception as e:
+                self.log(f"Execution error: {e}", "bold red")
+                return
+            if result.timed_out or result.returncode != 0:
+                what = f"stopped after the {timeout}s time limit" if result.timed_out else f"returned {result.returncode}"
+                self.log(f"Benchmark run {i + 1} {what}; stopping.", "bold red")
+                if stderr:
+                    self.log(stderr.rstrip(), "bold red")
+                return
+            if i >= warmup:
+                results.append(result)
+
+        summary = program_bench.summarize(results)
+        rss = f", peak RSS {summary['peak_rss_kb'] / 1024:.1f} MB" if summary["peak_rss_kb"] is not None else ""
+        self.log(f"{summary['runs']} runs: min {summary['min'] * 1000:.2f} ms, median {summary['median'] * 1000:.2f} ms, "
+                 f"p95 {summary['p95'] * 1000:.2f} ms{rss}")
+        if stdout_path:
+            self.log(f"Output of the last run written to {stdout_path}")
+
+        # Keyed by the path under out/, so every variant has its own history
+        key = os.path.relpath(exe, self.out_dir).replace(os.sep, "/")
+        binary = build_state.hash_file(exe)
+        history = program_bench.History(os.path.join(self.out_dir, program_bench.HISTORY_FILE))
+        previous = history.previous(key, binary)
+        if previous:
+            change, p_value, regressed = program_bench.compare(summary, previous)
+            same = " (same binary)" if previous.get("binary") == binary else ""
+            detail = f"median {previous['median'] * 1000:.2f} ms -> {summary['median'] * 1000:.2f} ms ({change * 100:+.1f}%"
+            detail += f", p={p_value:.3f})" if p_value is not None else "; too few runs for a significance test)"
+            if regressed:
+                self.log(f"Significant regression against the previous build{same}: {detail}", "bold red")
+            else:
+                self.log(f"Compared with the previous build{same}: {detail}")
+        history.add(key, binary, summary)
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            if result.stderr:
-                self.log(result.stderr, "bold red")
-            self.log("Build successful!", "bold green")
-        except subprocess.CalledProcessError as e:
-            self.log("Linking failed.", "bold red")
-            self.log(e.stderr, "bold red")
+            history.save()
+        except OSError as e:
+            self.log(f"Could not write benchmark history: {e}", "bold red")
+
+    def _build_pgo(self, source_files, pgo_args=None, pgo_input=None, run=True, run_timeout=None, **build_options):
+        """
+        Profile-guided build: builds an instrumented program, runs it once
+        with pgo_args (and pgo_input on stdin) to collect a profile, merges
+        the profile (clang) and rebuilds with it. Both stages share out/pgo,
+        so GCC finds its .gcda counters next to the objects.
+        """
+        build_options.pop("variant", None)
+        variant_dir = variants.output_dir(self.out_dir, variants.PGO_GENERATE)
+        if os.path.isdir(variant_dir):
+            variants.clear_profile(variant_dir)
+
+        self.log("PGO: building the instrumented program...", "bold")
+        if not self._build_and_run(source_files, run=False, variant=variants.PGO_GENERATE, **build_options):
+            return False
+        if not self.last_executable:
+            self.log("PGO training needs a single program; name one with --target.", "bold red")
             return False
 
-        if run:
-            self.log("Running...", "bold")
+        self.tracer.phase("pgo training")
+        cmd = [self.last_executable] + split_flags(pgo_args)
+        self.log(f"PGO: training with {' '.join(cmd)}", "bold")
+        try:
+            stdin = open(self._source_path(pgo_input), 'rb') if pgo_input else None
+        except OSError as e:
+            self.log(f"Cannot open training input: {e}", "bold red")
+            return False
+        try:
+            result = program_runner.run_program(cmd, self.log, cwd=self.working_dir, env=self._run_env(),
+                                                timeout=run_timeout, stdin=stdin)
+        except Exception as e:
+            self.log(f"Training run failed: {e}", "bold red")
+            return False
+        finally:
+            if stdin:
+                stdin.close()
+        usage = program_runner.format_usage(result)
+        if result.timed_out or result.returncode != 0:
+            # Counters are written at exit, so a crashed or killed run leaves little behind
+            self.log(f"Training run ended with return code {result.returncode} ({usage}); its profile may be incomplete.", "bold red")
+        else:
+            self.log(f"Training run finished ({usage})")
 
-            env = os.environ.copy()
-            bin_path = vcpkg_mgr.get_bin_path()
-            if os.path.exists(bin_path):
-                env["PATH"] = bin_path + os.pathsep + env["PATH"]
+        # clang writes .profraw files into the profile folder, GCC .gcda files next to the objects
+        profile_dir = os.path.join(variant_dir, variants.PROFILE_DIR)
+        raw = sorted(os.path.join(profile_dir, f) for f in os.listdir(profile_dir)
+                     if f.endswith(".profraw")) if os.path.isdir(profile_dir) else []
+        if not raw and not any(f.endswith(".gcda") for f in os.listdir(variant_dir)):
+            self.log("The training run wrote no profile.", "bold red")
+            return False
+        if raw:
+            profdata = find_tool_path("llvm-profdata")
+            if not profdata:
+                self.log("llvm-profdata was not found; it is needed to merge clang profiles.", "bold red")
+                return False
+            merged = os.path.join(variant_dir, variants.PROFDATA_FILE)
+            returncode, stderr, _ = _run_compile([profdata, "merge", f"-output={merged}"] + raw, cwd=self.working_dir)
+            if returncode != 0:
+                self.log(f"Merging the profile failed:\n{stderr}", "bold red")
+                return False
+            self.log(f"PGO: merged {len(raw)} profile(s) into {os.path.basename(merged)}")
 
-            try:
-                p = subprocess.Popen([output_exe], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, encoding='utf-8', errors='replace')
+        self.log("PGO: rebuilding with the profile...", "bold")
+        return self._build_and_run(source_files, run=run, run_timeout=run_timeout, variant=variants.PGO_USE, **build_options)
+
+    def _build_profile_run(self, source_files, run_timeout=None, memory_limit_mb=None, **build_options):
+        """
+        Rebuilds into a profiling variant and runs the program under perf
+        (frame-pointer build) or, without perf, gprof (-pg build). Logs the
+        top functions by self time and writes collapsed stacks for flame
+        graphs next to the program.
+        """
+        # The profiling build replaces the chosen variant and the usual run
+        for option in ("variant", "pgo_args", "pgo_input", "bench", "bench_warmup", "bench_output", "run"):
+            build_options.pop(option, None)
+        def build(variant):
+            if not self._build_and_run(source_files, run=False, variant=variant, **build_options):
+                return None
+            if not self.last_executable:
+                self.log("Profiling needs a single program; name one with --target.", "bold red")
+            return self.last_executable
 
-                # Stream output
-                if p.stdout:
-                    for line in iter(p.stdout.readline, ''):
-                        if line.strip(): self.log(line.strip())
+        tools = get_toolchain()
+        if os.name != "nt" and tools.has("perf"):
+            exe = build(variants.PROFILE_FP)
+            if not exe:
+                return False
+            if self._perf_run(exe, run_timeout, memory_limit_mb):
+                return True
+            self.log("Falling back to gprof.")
+        if not tools.has("gprof"):
+            self.log("Neither perf nor gprof was found; install one of them to profile.", "bold red")
+            return False
+        exe = build(variants.PROFILE_PG)
+        return self._gprof_run(exe, run_timeout, memory_limit_mb) if exe else False
 
-                # Check for errors after execution
-                p.wait()
-                if p.returncode != 0:
-                    err_data = p.stderr.read() if p.stderr else ""
-                    if err_data.strip():
-                        self.log(f"Execution finished with return code {p.returncode}", "bold red")
-                        self.log(err_data.strip(), "bold red")
+    def _perf_run(self, exe, timeout=None, memory_limit_mb=None):
+        """Records exe with perf and reports it. Returns False if perf could not record."""
+        perf = get_toolchain().path("perf")
+        data = os.path.splitext(exe)[0] + ".perf.data"
+        self.tracer.phase("profile run")
+        self.log(f"Running {os.path.basename(exe)} under perf...", "bold")
+        result = program_runner.run_program([perf, "record", "-q", "--call-graph=fp", "-o", data, "--", exe],
+                                            self.log, cwd=self.working_dir, env=self._run_env(),
+                                            timeout=timeout, memory_limit_mb=memory_limit_mb)
+        if not os.path.exists(data) or os.path.getsize(data) == 0:
+            self.log(f"perf record failed (return code {result.returncode}); perf_event_paranoid may forbid it.", "bold red")
+            return False
+        self.log(f"Execution finished with return code {result.returncode} ({program_runner.format_usage(result)})")
 
-            except Exception as e:
-                self.log(f"Execution error: {e}", "bold red")
+        self.tracer.phase("profile report")
+        returncode, output, stderr = _run_output([perf, "script", "-i", data], cwd=self.working_dir)
+        stacks = profiling.parse_perf_script(output)
+        if returncode != 0 or not stacks:
+            self.log(f"perf script produced no samples. {stderr.strip()}", "bold red")
+            return True
+        totals = profiling.self_time(stacks)
+        samples = sum(totals.values())
+        rows = [(name, f"{count} smp", 100.0 * count / samples, None) for name, count in totals.most_common()]
+        self.log(f"{samples} samples recorded.")
+        profiling.report_top(rows, self.log)
+        self._write_collapsed(exe, stacks)
+        return True
+
+    def _gprof_run(self, exe, timeout=None, memory_limit_mb=None):
+        """Runs a -pg build of exe and reports gprof's flat profile and call graph."""
+        gmon_dir = os.path.dirname(exe)
+        for name in os.listdir(gmon_dir):
+            if name.startswith("gmon.out"):
+                os.remove(os.path.join(gmon_dir, name))
+        env = self._run_env()
+        # glibc writes gmon.out.<pid> here instead of gmon.out in the working folder
+        env["GMON_OUT_PREFIX"] = os.path.join(gmon_dir, "gmon.out")
 
+        self.tracer.phase("profile run")
+        self.log(f"Running {os.path.basename(exe)} with gprof instrumentation...", "bold")
+        result = program_runner.run_program([exe], self.log, cwd=self.working_dir, env=env,
+                                            timeout=timeout, memory_limit_mb=memory_limit_mb)
+        self.log(f"Execution finished with return code {result.returncode} ({program_runner.format_usage(result)})")
+        stray = os.path.join(self.working_dir, "gmon.out")
+        if os.path.exists(stray):
+            os.replace(stray, os.path.join(gmon_dir, "gmon.out"))
+        profiles = sorted(os.path.join(gmon_dir, n) for n in os.listdir(gmon_dir) if n.startswith("gmon.out"))
+        if not profiles:
+            self.log("The program wrote no gmon.out; it has to exit normally for gprof to get a profile.", "bold red")
+            return False
+
+        self.tracer.phase("profile report")
+        gprof = get_toolchain().path("gprof")
+        returncode, flat, stderr = _run_output([gprof, "-b", "-p", exe] + profiles, cwd=self.working_dir)
+        if returncode != 0:
+            self.log(f"gprof failed: {stderr.strip()}", "bold red")
+            return False
+        _, graph, _ = _run_output([gprof, "-b", "-q", exe] + profiles, cwd=self.working_dir)
+        rows = [(name, f"{seconds * 1000:.0f} ms", percent, calls)
+                for name, seconds, percent, calls in profiling.parse_gprof_flat(flat)]
+        if not rows:
+            self.log("gprof recorded no samples; the program may have run too briefly.")
+            return True
+        profiling.report_top(rows, self.log)
+        self._write_collapsed(exe, profiling.gprof_stacks(*profiling.parse_gprof_call_graph(graph)))
+        return True
+
+    def _write_collapsed(self, exe, stacks):
+        path = os.path.splitext(exe)[0] + ".folded"
+        try:
+            profiling.write_collapsed(path, stacks)
+            self.log(f"Collapsed stacks written to {path} (open with flamegraph.pl or speedscope)")
+        except OSError as e:
+            self.log(f"Could not write collapsed stacks: {e}", "bold red")
+
+    def _linker_for(self, sources):
+        """The profile's linker, else the C++ or C driver depending on the sources."""
+        linker = self.profile.get("linker")
+        if linker:
+            return linker
+        if any(f.lower().endswith(build_state.CPP_EXTENSIONS) for f in sources):
+            return find_tool_path("clang++", "g++") or GPP_EXE
+        return find_tool_path("clang", "gcc") or GCC_EXE
+
+    def _fuse_ld_flags(self, linker, fuse_ld=None, lto=False):
+        """
+        Picks the linker the driver should use. "auto" (the default, or the
+        profile's "fuse_ld") prefers mold, then lld, when the toolchain has
+        them and the driver supports them; "default" leaves the driver's
+        choice; any other name is passed as -fuse-ld=<name>. lld can't load
+        GCC's LTO plugin, so GCC LTO links never pick it automatically.
+        """
+        fuse_ld = fuse_ld or self.profile.get("fuse_ld") or "auto"
+        if fuse_ld == "default":
+            return []
+        if fuse_ld != "auto":
+            return [f"-fuse-ld={fuse_ld}"]
+        tools = get_toolchain()
+        # mold only produces ELF binaries
+        if os.name != "nt" and tools.supports(linker, "mold"):
+            return ["-fuse-ld=mold"]
+        if tools.supports(linker, "lld") and not (lto and tools.family(linker) == "gcc"):
+            return ["-fuse-ld=lld"]
+        return []
+
+    def _split_debug_flags(self, sample_source, user_flags):
+        """Compile flags that move debug info into .dwo files next to the objects."""
+        compiler = get_compiler_for_file(sample_source, self.profile)
+        if os.name == "nt" or not get_toolchain().supports(compiler, "split_dwarf"):
+            self.log("Split debug info is not supported by this toolchain; ignoring --split-debug.")
+            return []
+        has_debug = any(f.startswith("-g") and f not in ("-g0", "-gsplit-dwarf") for f in user_flags)
+        return ["-gsplit-dwarf"] if has_debug else ["-g", "-gsplit-dwarf"]
+
+    def _link_arguments(self, lib_path, required_packages):
+        """Library search path, package libraries and runtime flags shared by every link."""
+        args = []
+        if os.path.exists(lib_path):
+            args.extend(["-L", lib_path])
+
+        # Add required libraries. This is a simplified approach.
+        # A more robust solution would involve checking vcpkg's installed files.
+        for pkg in sorted(required_packages or ()):
+            if pkg == "nlohmann-json": continue
+            if pkg == "fmt": args.append("-lfmt"); continue
+            if pkg == "sqlite3": args.append("-lsqlite3"); continue
+            if pkg == "curl": args.append("-lcurl"); continue
+            args.append(f"-l{pkg}")
+
+        args.extend(["-static-libgcc", "-static-libstdc++"])
+        return args
+
+    def _link_output(self, output, cmd, inputs, state, clean, log):
+        """
+        Runs a link (or archive) command unless the build manifest says
+        output is up to date. Returns True on success.
+        """
+        name = os.path.basename(output)
+        reason = "clean build" if clean else state.needs_relink(output, cmd)
+        if not reason:
+            log(f"Skipping link of {name} (up to date)")
+            self.tracer.add(name, "link", time.perf_counter(), 0.0, skipped=True)
+            return True
+
+        log(f"Linking {name}...")
+        fuse_ld = next((arg.split("=", 1)[1] for arg in cmd if arg.startswith("-fuse-ld=")), None)
+        previous = state.last_link_seconds(output)
+        start = time.perf_counter()
+        returncode, stderr, cpu = _run_compile(cmd, cwd=self.working_dir)
+        seconds = time.perf_counter() - start
+        self.tracer.add(name, "link", start, seconds, cpu, reason=reason, previous=previous, fuse_ld=fuse_ld)
+        if returncode != 0:
+            state.forget_link(output)
+            log(f"Linking {name} failed.", "bold red")
+            if stderr:
+                log(stderr, "bold red")
+            return False
+        if stderr:
+            log(stderr, "bold red")
+        state.record_link(output, cmd, inputs, seconds)
+        return True
+
+    def _link_targets(self, manifest, selected, link_args, state, clean, fuse_ld=None, out_dir=None, lto=False, family="gcc"):
+        """
+        Archives library targets and links executables, each as soon as the
+        libraries it needs are done, so independent targets link in parallel.
+        Objects were compiled once for all targets. Returns True on success.
+        """
+        out_dir = out_dir or self.out_dir
+        if lto:
+            # LTO objects hold compiler IR; only the matching archiver can index them
+            archiver = find_tool_path("llvm-ar", "ar") if family == "clang" else find_tool_path("gcc-ar", "ar")
+        else:
+            archiver = find_tool_path("ar", "llvm-ar")
+        archiver = archiver or os.path.join(GCC_BIN, "llvm-ar.exe")
+
+        def archive_path(target):
+            return os.path.join(out_dir, f"lib{target.name}.a")
+
+        def link(target, step_log):
+            objects = [build_state.object_path_for(src, out_dir) for src in target.sources]
+            if target.kind == "lib":
+                output = archive_path(target)
+                cmd = [archiver, "rcs", output] + objects
+                if not clean and not state.needs_relink(output, cmd):
+                    step_log(f"Skipping archive of {os.path.basename(output)} (up to date)")
+                    self.tracer.add(os.path.basename(output), "link", time.perf_counter(), 0.0, skipped=True)
+                    return
+                # `ar r` keeps members that are no longer listed, so start from scratch
+                if os.path.exists(output):
+                    os.remove(output)
+                inputs = objects
+            else:
+                output = os.path.join(out_dir, target.name + ".exe")
+                libraries = [archive_path(lib) for lib in manifest.link_libraries(target)]
+                sources = target.sources + [src for lib in manifest.link_libraries(target) for src in lib.sources]
+                linker = self._linker_for(sources)
+                cmd = [linker] + self._fuse_ld_flags(linker, fuse_ld, lto) + objects + libraries + ["-o", output] + link_args
+                inputs = objects + libraries
+            if not self._link_output(output, cmd, inputs, state, clean, step_log):
+                raise Exception(f"Target {target.name} failed to link")
+
+        steps = {t.name: (lambda step_log, t=t: link(t, step_log), t.deps) for t in selected}
+        try:
+            run_step_graph(steps, self.log)
+        except Exception as e:
+            self.log(str(e), "bold red")
+            return False
         return True
 
 def main():
     ui.display_header()
     args = ui.parse_arguments()
+    startup_profile.mark("argument parsing")
 
     # Define a logger for the CLI that maps to the `ui` functions
     def cli_logger(message, style=""):
@@ -294,9 +1094,86 @@ def main():
         else:
             ui.display_status(message)
 
+    if args.cache_clear or args.cache_stats:
+        cache = object_cache.ObjectCache(OBJECT_CACHE_DIR)
+        if args.cache_clear:
+            cache.clear()
+            cli_logger("Object cache cleared.", "bold green")
+        if args.cache_stats:
+            show_cache_stats(cache, cli_logger)
+        if not args.files:
+            return
+
+    if args.server or args.server_stop:
+        # Imported here: it needs the fully initialised cmpile module
+        import build_server
+        if args.server_stop:
+            if build_server.stop_server():
+                cli_logger("Build server stopped.", "bold green")
+            else:
+                cli_logger("No build server is running.")
+            return
+        server = build_server.BuildServer(cli_logger, jobs=args.jobs)
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            cli_logger("Build server stopped.")
+        return
+
+    # Without files, a cmpile.json in the current folder describes the build
+    project_file = args.project or (None if args.files else project.Project.find(os.getcwd()))
+    working_dir = os.path.dirname(os.path.abspath(project_file)) if project_file else None
+
+    build_options = dict(compiler_flags=args.compiler_flags, clean=args.clean, run=True,
+                         jobs=args.jobs, keep_going=args.keep_going, use_pch=not args.no_pch,
+                         unity=args.unity_groups or (0 if args.unity else None), trace=args.trace_file or ("out/trace.json" if args.trace else None),
+                         run_timeout=args.run_timeout, memory_limit_mb=args.memory_limit)
+    if args.fuse_ld:
+        build_options["fuse_ld"] = args.fuse_ld
+    if args.split_debug:
+        build_options["split_debug"] = True
+    if args.variant:
+        build_options["variant"] = args.variant
+    if args.variant == "pgo":
+        build_options.update(pgo_args=args.pgo_train, pgo_input=args.pgo_input)
+    if args.profile_run:
+        build_options["profile_run"] = True
+    if args.bench:
+        build_options.update(bench=args.bench, bench_warmup=args.bench_warmup, bench_output=args.bench_output)
+    if project_file:
+        build_options.update(project_file=os.path.abspath(project_file), targets=args.targets)
+
+    if args.use_server and not args.watch:
+        import build_server
+        if build_server.request_build(args.files, cli_logger, working_dir=working_dir, use_cache=not args.no_cache,
+                                      startup_profile=args.startup_profile, **build_options) is not None:
+            return
+        cli_logger("No build server is running; building locally.")
+
     # In CLI mode, the builder is provided with our CLI logger
-    builder = CmpileBuilder(log_callback=cli_logger)
-    builder.build_and_run(args.files, args.compiler_flags, args.clean, run=True)
+    builder = CmpileBuilder(log_callback=cli_logger, use_cache=not args.no_cache,
+                            profile_startup=args.startup_profile, working_dir=working_dir)
+    if args.watch:
+        try:
+            builder.watch(args.files, **build_options)
+        except KeyboardInterrupt:
+            cli_logger("Stopped watching.")
+        return
+    builder.build_and_run(args.files, **build_options)
+
+def show_cache_stats(cache, log_func):
+    stats = cache.stats()
+    hits = stats.get("hits", 0)
+    misses = stats.get("misses", 0)
+    lookups = hits + misses
+    hit_rate = (100.0 * hits / lookups) if lookups else 0.0
+    log_func(f"Object cache: {cache.cache_dir}")
+    log_func(f"  Hits:      {hits}")
+    log_func(f"  Misses:    {misses}")
+    log_func(f"  Hit rate:  {hit_rate:.1f}%")
+    log_func(f"  Entries:   {stats['entries']}")
+    log_func(f"  Size:      {stats['size'] / 1024 / 1024:.1f} MB of {stats['max_size'] / 1024 / 1024:.0f} MB")
+    log_func(f"  Evictions: {stats.get('evictions', 0)}")
 
 if __name__ == "__main__":
     try:
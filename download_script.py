@@ -1,19 +1,29 @@
 import os
 import sys
+import json
 import shutil
 import zipfile
+import zlib
+import hashlib
+import threading
+import contextlib
 import subprocess
-import requests
-import time
-import errno
-from rich.console import Console
-from rich.progress import Progress
+import concurrent.futures
 
-console = Console()
+# requests and rich are only imported once a download actually starts or
+# something is printed through rich, which keeps `import cmpile` cheap.
+_console = None
+
+def get_console():
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
 
 def _default_log(message, style=""):
     # Helper for standalone script running
-    console.print(f"[{style}]{message}[/{style}]" if style else message)
+    get_console().print(f"[{style}]{message}[/{style}]" if style else message)
 
 if getattr(sys, 'frozen', False):
     # Running as compiled exe
@@ -32,109 +42,377 @@ GCC_URL = "https://github.com/mstorsjo/llvm-mingw/releases/download/20220323/llv
 # MinGit
 GIT_URL = "https://github.com/git-for-windows/git/releases/download/v2.43.0.windows.1/MinGit-2.43.0-64-bit.zip"
 
+# Published SHA-256 of the archives above; a download whose checksum does
+# not match is discarded instead of being extracted. While a pin is None
+# the checksum of the first download is recorded in CHECKSUMS_PATH and
+# every later download of the same URL has to match it.
+GCC_SHA256 = None
+GIT_SHA256 = None
+CHECKSUMS_PATH = os.path.join(INTERNAL_DOWNLOADS, "checksums.json")
+
 GIT_DIR = os.path.join(INTERNAL_DOWNLOADS, "git")
 
-def download_file(url, target_path, log_func=_default_log):
+# Downloads are split into this many ranged connections
+DOWNLOAD_SEGMENTS = 4
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Files smaller than this are fetched over a single connection
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+# Seconds to wait for the server before giving up on a connection
+DOWNLOAD_TIMEOUT = 30
+
+class DownloadError(Exception):
+    pass
+
+def _probe(url):
+    """
+    Asks for the first byte of url. Returns (total_size, supports_ranges);
+    total_size is 0 when the server does not say.
+    """
+    import requests
+
+    with requests.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code == 206:
+            # Content-Range: bytes 0-0/123456
+            total = response.headers.get("content-range", "").rpartition("/")[2]
+            if total.isdigit():
+                return int(total), True
+        return int(response.headers.get("content-length", 0)), False
+
+def _load_resume_state(state_path, part_path, url, total_size):
+    """Returns the saved segments of an interrupted download of url, or None."""
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("url") != url or state.get("size") != total_size:
+            return None
+        if os.path.getsize(part_path) != total_size:
+            return None
+        return state["segments"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _save_resume_state(state_path, url, total_size, segments):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"url": url, "size": total_size, "segments": segments}, f)
+    os.replace(tmp_path, state_path)
+
+def _plan_segments(total_size, segments):
+    """Splits [0, total_size) into [start, end, done] byte ranges (end inclusive)."""
+    count = max(1, min(segments, total_size // MIN_SEGMENT_SIZE))
+    step = -(-total_size // count)
+    return [[start, min(start + step, total_size) - 1, 0] for start in range(0, total_size, step)]
+
+def _fetch_segment(url, part_path, segment, lock, advance, stop):
+    """Downloads the rest of one [start, end, done] range into part_path."""
+    import requests
+
+    start, end, done = segment
+    if start + done > end:
+        return
+    headers = {"Range": f"bytes={start + done}-{end}"}
+    with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise DownloadError("Server stopped honouring range requests.")
+        with open(part_path, 'r+b') as f:
+            f.seek(start + done)
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if stop.is_set():
+                    return
+                f.write(chunk)
+                # Only count bytes once they reached the OS, so a resume never skips data
+                f.flush()
+                with lock:
+                    segment[2] += len(chunk)
+                advance(len(chunk))
+    if segment[0] + segment[2] <= segment[1]:
+        raise DownloadError(f"Connection closed early in bytes {start}-{end}.")
+
+def _download_ranged(url, part_path, state_path, total_size, segments, advance, log_func):
+    state = _load_resume_state(state_path, part_path, url, total_size)
+    if state is not None:
+        resumed = sum(done for _, _, done in state)
+        log_func(f"Resuming download at {resumed / 1024 / 1024:.2f} MB.")
+        advance(resumed)
+    else:
+        with open(part_path, 'wb') as f:
+            f.truncate(total_size)
+        state = _plan_segments(total_size, segments)
+    _save_resume_state(state_path, url, total_size, state)
+
+    lock = threading.Lock()
+    stop = threading.Event()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(state)) as pool:
+        futures = [pool.submit(_fetch_segment, url, part_path, segment, lock, advance, stop) for segment in state]
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, timeout=1.0, return_when=concurrent.futures.FIRST_EXCEPTION)
+                with lock:
+                    _save_resume_state(state_path, url, total_size, state)
+                for future in done:
+                    future.result()
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            with lock:
+                _save_resume_state(state_path, url, total_size, state)
+
+def _download_single(url, part_path, advance):
+    """Plain streamed download for servers without range support; always starts over."""
+    import requests
+
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(part_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                advance(len(chunk))
+
+def _load_checksums():
+    try:
+        with open(CHECKSUMS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _record_checksum(url, sha256):
+    checksums = _load_checksums()
+    checksums[url] = sha256
+    os.makedirs(os.path.dirname(CHECKSUMS_PATH), exist_ok=True)
+    tmp_path = CHECKSUMS_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checksums, f, indent=1)
+    os.replace(tmp_path, CHECKSUMS_PATH)
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def download_file(url, target_path, log_func=_default_log, segments=DOWNLOAD_SEGMENTS, sha256=None):
+    """
+    Downloads url to target_path over up to `segments` ranged connections.
+
+    Data goes to target_path + ".part" and the progress of each range to
+    ".part.json", so an interrupted download resumes where it stopped.
+    Servers that ignore Range get a single connection that starts over.
+    The file is only renamed to target_path once it is complete and its
+    checksum matches sha256, or else the one recorded for url by an
+    earlier download; a mismatching file is deleted. Without either the
+    checksum is recorded.
+    """
     # If a custom log_func is provided, we avoid using the Rich progress bar
     # as it's not suitable for GUI logs.
     use_progress = (log_func == _default_log) and sys.stdout is not None and getattr(sys.stdout, 'isatty', lambda: False)()
 
+    part_path = target_path + ".part"
+    state_path = part_path + ".json"
+    name = os.path.basename(target_path)
+
     try:
-        with requests.get(url, stream=True) as response:
-            response.raise_for_status()
-            total_size = int(response.headers.get("content-length", 0))
+        total_size, ranged = _probe(url)
+        ranged = ranged and segments > 1 and total_size > 0
 
+        with contextlib.ExitStack() as stack:
             if use_progress:
-                with Progress(console=console) as progress:
-                    task = progress.add_task(f"Downloading {os.path.basename(target_path)}...", total=total_size)
-                    with open(target_path, "wb") as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                            progress.update(task, advance=len(chunk))
+                from rich.progress import Progress
+                progress = stack.enter_context(Progress(console=get_console()))
+                task = progress.add_task(f"Downloading {name}...", total=total_size or None)
+                advance = lambda n: progress.update(task, advance=n)
+            else:
+                log_func(f"Downloading {name} ({total_size / 1024 / 1024:.2f} MB)...")
+                advance = lambda n: None
+
+            if ranged:
+                _download_ranged(url, part_path, state_path, total_size, segments, advance, log_func)
             else:
-                log_func(f"Downloading {os.path.basename(target_path)} ({total_size / 1024 / 1024:.2f} MB)...")
-                with open(target_path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                log_func("Download complete.")
+                if os.path.exists(state_path):
+                    os.remove(state_path)
+                _download_single(url, part_path, advance)
+
+        if total_size and os.path.getsize(part_path) != total_size:
+            raise DownloadError(f"Expected {total_size} bytes but got {os.path.getsize(part_path)}.")
+        expected = sha256 or _load_checksums().get(url)
+        actual = sha256_file(part_path)
+        if expected and actual.lower() != expected.lower():
+            os.remove(part_path)
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            raise DownloadError(f"SHA-256 mismatch for {name}: expected {expected}, got {actual}.")
+        if not expected:
+            log_func(f"No pinned checksum for {name}; recording SHA-256 {actual} for later downloads.", "bold yellow")
+            _record_checksum(url, actual)
+
+        os.replace(part_path, target_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        if not use_progress:
+            log_func("Download complete.")
 
     except Exception as e:
         log_func(f"Failed to download {url}: {e}", "bold red")
         raise e
 
-def install_git(log_func=_default_log):
-    if os.path.exists(GIT_DIR) and os.path.exists(os.path.join(GIT_DIR, "cmd", "git.exe")):
-         return
+# Written into an extracted folder once every member is in place
+EXTRACT_MARKER = ".extracted.json"
 
-    os.makedirs(INTERNAL_DOWNLOADS, exist_ok=True)
+def _archive_identity(zip_path):
+    st = os.stat(zip_path)
+    return {"archive": os.path.basename(zip_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def is_extracted(dest_dir, zip_path=None):
+    """True when dest_dir holds a completed extraction (of zip_path, if given)."""
+    try:
+        with open(os.path.join(dest_dir, EXTRACT_MARKER), 'r', encoding='utf-8') as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if zip_path is None:
+        return True
+    try:
+        return marker == _archive_identity(zip_path)
+    except OSError:
+        return False
+
+def _common_prefix(names):
+    """Returns "top/" when every member lives under the same top-level folder, else ""."""
+    tops = {name.split("/", 1)[0] for name in names}
+    if len(tops) == 1 and all("/" in name for name in names if not name.endswith("/")):
+        return tops.pop() + "/"
+    return ""
+
+def _file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+def _is_intact(info, path, verify):
+    try:
+        if os.path.getsize(path) != info.file_size:
+            return False
+    except OSError:
+        return False
+    # Members are renamed into place once fully written, so a matching size
+    # means the file is complete; verify also catches later corruption.
+    return not verify or _file_crc32(path) == info.CRC
+
+def _extract_member(zip_ref, info, path, verify):
+    """Writes one member to path unless an intact copy is already there. Returns True if written."""
+    if _is_intact(info, path, verify):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with zip_ref.open(info) as src, open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+    mode = (info.external_attr >> 16) & 0o777
+    if mode and os.name != "nt":
+        os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+    return True
+
+def extract_archive(zip_path, dest_dir, log_func=_default_log, strip_prefix=True, verify=False, jobs=None):
+    """
+    Extracts zip_path straight into dest_dir on a thread pool.
+
+    With strip_prefix, a top-level folder shared by all members is dropped,
+    so "llvm-mingw-.../bin/x" lands in dest_dir/bin/x. Members already
+    present with the right size (and CRC, with verify) are skipped, which
+    makes re-running after an interruption or on a damaged install cheap.
+    A marker file is written atomically once every member is in place.
+    """
+    marker_path = os.path.join(dest_dir, EXTRACT_MARKER)
+    os.makedirs(dest_dir, exist_ok=True)
+    if os.path.exists(marker_path):
+        os.remove(marker_path)
+
+    root = os.path.realpath(dest_dir)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        infos = zip_ref.infolist()
+        prefix = _common_prefix([info.filename for info in infos]) if strip_prefix else ""
+
+        members = []
+        for info in infos:
+            name = info.filename[len(prefix):]
+            if not name:
+                continue
+            path = os.path.realpath(os.path.join(root, *name.rstrip("/").split("/")))
+            if not path.startswith(root + os.sep):
+                raise Exception(f"Refusing to extract {info.filename} outside {dest_dir}")
+            if info.is_dir():
+                os.makedirs(path, exist_ok=True)
+            else:
+                members.append((info, path))
+
+        # Largest members first so one big file doesn't finish last on its own
+        members.sort(key=lambda member: member[0].file_size, reverse=True)
+        # zipfile lets several members be read at once; zlib releases the GIL
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            written = sum(pool.map(lambda member: _extract_member(zip_ref, member[0], member[1], verify), members))
+
+    tmp_path = marker_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_archive_identity(zip_path), f)
+    os.replace(tmp_path, marker_path)
+    log_func(f"Extracted {written} of {len(members)} file(s) ({len(members) - written} already in place).")
+
+def install_git(log_func=_default_log, verify=False):
+    """
+    Installs MinGit into GIT_DIR. The archive is kept next to it, so an
+    interrupted or (with verify) damaged install is repaired in place.
+    """
+    git_exe = os.path.join(GIT_DIR, "cmd", "git.exe")
     zip_path = os.path.join(INTERNAL_DOWNLOADS, "git.zip")
+    # Installs from before the extraction marker have no archive left to check against
+    if os.path.exists(git_exe) and (not os.path.exists(zip_path) or (not verify and is_extracted(GIT_DIR, zip_path))):
+        return
+
+    os.makedirs(INTERNAL_DOWNLOADS, exist_ok=True)
 
     if not os.path.exists(zip_path):
         log_func(f"Downloading MinGit from {GIT_URL}...")
         try:
-            download_file(GIT_URL, zip_path, log_func=log_func)
+            download_file(GIT_URL, zip_path, log_func=log_func, sha256=GIT_SHA256)
         except Exception as e:
             log_func(f"Failed to download Git: {e}", "bold red")
             return
 
     log_func("Extracting Git...")
     try:
-        os.makedirs(GIT_DIR, exist_ok=True)
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(GIT_DIR)
-
+        # MinGit has no top-level folder, so there is nothing to strip
+        extract_archive(zip_path, GIT_DIR, log_func=log_func, strip_prefix=False, verify=verify)
         log_func("Git installed successfully.", "bold green")
-        os.remove(zip_path)
     except Exception as e:
          log_func(f"Failed to extract Git: {e}", "bold red")
 
-def install_gcc(log_func=_default_log):
-    if os.path.exists(GCC_DIR) and os.path.exists(os.path.join(GCC_DIR, "bin", "clang++.exe")):
+def install_gcc(log_func=_default_log, verify=False):
+    """Installs LLVM-MinGW into GCC_DIR; see install_git for how repairs work."""
+    clang_exe = os.path.join(GCC_DIR, "bin", "clang++.exe")
+    zip_path = os.path.join(INTERNAL_DOWNLOADS, "compiler.zip")
+    if os.path.exists(clang_exe) and (not os.path.exists(zip_path) or (not verify and is_extracted(GCC_DIR, zip_path))):
         return
 
     os.makedirs(INTERNAL_DOWNLOADS, exist_ok=True)
-    zip_path = os.path.join(INTERNAL_DOWNLOADS, "compiler.zip")
 
     if not os.path.exists(zip_path):
         log_func(f"Downloading LLVM-MinGW from {GCC_URL}...")
-        download_file(GCC_URL, zip_path, log_func=log_func)
+        download_file(GCC_URL, zip_path, log_func=log_func, sha256=GCC_SHA256)
 
     log_func("Extracting Compiler...")
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(INTERNAL_DOWNLOADS)
-
-        extracted_name = None
-        for name in os.listdir(INTERNAL_DOWNLOADS):
-            if name.startswith("llvm-mingw"):
-                extracted_name = name
-                break
-
-        if extracted_name:
-                extracted_path = os.path.join(INTERNAL_DOWNLOADS, extracted_name)
-
-                max_retries = 5
-                for i in range(max_retries):
-                    try:
-                        if os.path.exists(GCC_DIR):
-                            def on_rm_error(func, path, exc_info):
-                                os.chmod(path, 0o777)
-                                func(path)
-                            shutil.rmtree(GCC_DIR, onerror=on_rm_error)
-
-                        time.sleep(0.5)
-                        shutil.move(extracted_path, GCC_DIR)
-                        break
-                    except (PermissionError, OSError) as e:
-                        if (isinstance(e, OSError) and e.errno not in [errno.EACCES, errno.ENOTEMPTY]) or i == max_retries - 1:
-                            raise
-                        time.sleep(1)
-        else:
-            raise Exception(f"Extraction failed: Could not find llvm-mingw folder in {INTERNAL_DOWNLOADS}")
+        # The archive's llvm-mingw-<version>/ folder is stripped, so files land in GCC_DIR directly
+        extract_archive(zip_path, GCC_DIR, log_func=log_func, strip_prefix=True, verify=verify)
+        if not os.path.exists(clang_exe):
+            raise Exception(f"Extraction failed: {clang_exe} is missing")
 
         log_func("Compiler installed successfully.", "bold green")
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
     except Exception as e:
         log_func(f"Compiler installation failed: {e}", "bold red")
         raise e
@@ -3,9 +3,18 @@ import os
 import threading
 from tkinter import filedialog
 import cmpile
+import build_server
+import log_sink
 import sys
 import json
 
+# The output pane is refreshed on this tick and keeps at most this many lines;
+# the full log of each build is written to out/build.log
+LOG_TICK_MS = 50
+LOG_MAX_LINES = 5000
+LOG_FILE = "build.log"
+DEFAULT_VARIANT = "Default"
+
 # Set theme
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
@@ -68,6 +77,27 @@ class App(ctk.CTk):
         self.clean_checkbox = ctk.CTkCheckBox(self.options_frame, text="Clean Build")
         self.clean_checkbox.pack(side="left", padx=10, pady=10)
 
+        self.jobs_entry = ctk.CTkEntry(self.options_frame, width=60, placeholder_text="Jobs")
+        self.jobs_entry.insert(0, str(os.cpu_count() or 1))
+        self.jobs_entry.pack(side="left", padx=10, pady=10)
+
+        self.keep_going_checkbox = ctk.CTkCheckBox(self.options_frame, text="Keep Going")
+        self.keep_going_checkbox.pack(side="left", padx=10, pady=10)
+
+        # PGO needs a training run, so it is only offered on the command line
+        self.variant_menu = ctk.CTkOptionMenu(self.options_frame, width=100, values=[DEFAULT_VARIANT, "debug", "release", "native"])
+        self.variant_menu.pack(side="left", padx=10, pady=10)
+
+        self.profile_run_checkbox = ctk.CTkCheckBox(self.options_frame, text="Profile Run")
+        self.profile_run_checkbox.pack(side="left", padx=10, pady=10)
+
+        self.watch_checkbox = ctk.CTkCheckBox(self.options_frame, text="Watch", command=self.toggle_watch)
+        self.watch_checkbox.pack(side="left", padx=10, pady=10)
+        self.watch_stop = threading.Event()
+
+        self.server_checkbox = ctk.CTkCheckBox(self.options_frame, text="Use Build Server")
+        self.server_checkbox.pack(side="left", padx=10, pady=10)
+
         self.build_btn = ctk.CTkButton(self.options_frame, text="Build & Run", command=self.start_build, fg_color="green", hover_color="darkgreen")
         self.build_btn.pack(side="right", padx=10, pady=10)
 
@@ -121,6 +151,8 @@ class App(ctk.CTk):
         self.new_profile_btn.pack(side="right", padx=10, pady=10)
 
         self.source_files = []
+        self.log_sink = log_sink.LogSink(max_lines=LOG_MAX_LINES)
+        self.after(LOG_TICK_MS, self._flush_log)
         self.builder = cmpile.CmpileBuilder(log_callback=self.log_message)
 
         self.profiles = {}
@@ -214,13 +246,22 @@ class App(ctk.CTk):
         return selected_files
 
     def log_message(self, message, style=""):
-        self.after(0, lambda: self._append_log(message, style))
-
-    def _append_log(self, message, style):
-        self.log_textbox.configure(state="normal")
-        self.log_textbox.insert("end", message + "\n")
-        self.log_textbox.see("end")
-        self.log_textbox.configure(state="disabled")
+        # Safe from any thread; the text is added to the pane on the next tick
+        self.log_sink.write(message, style)
+
+    def _flush_log(self):
+        text, trim = self.log_sink.drain()
+        if text:
+            self.log_textbox.configure(state="normal")
+            if trim:
+                self.log_textbox.delete("1.0", f"{trim + 1}.0")
+            self.log_textbox.insert("end", text)
+            self.log_textbox.see("end")
+            self.log_textbox.configure(state="disabled")
+            if self.log_sink.dropped:
+                where = f"; full log in {self.log_sink.spill_path}" if self.log_sink.spill_path else ""
+                self.log_label.configure(text=f"Output Log ({self.log_sink.dropped} earlier lines dropped{where})")
+        self.after(LOG_TICK_MS, self._flush_log)
 
     def start_build(self):
         selected_files = self.get_selected_files()
@@ -230,27 +271,63 @@ class App(ctk.CTk):
 
         flags = self.flags_entry.get()
         clean = self.clean_checkbox.get() == 1
+        keep_going = self.keep_going_checkbox.get() == 1
+        watch = self.watch_checkbox.get() == 1
+        use_server = self.server_checkbox.get() == 1
+        variant = self.variant_menu.get()
+        variant = None if variant == DEFAULT_VARIANT else variant
+        profile_run = self.profile_run_checkbox.get() == 1
+        try:
+            jobs = int(self.jobs_entry.get())
+        except ValueError:
+            jobs = None
 
         self.build_btn.configure(state="disabled")
+        profile = self.profiles.get(self.profile_menu.get())
+        self.builder = cmpile.CmpileBuilder(log_callback=self.log_message, profile=profile)
+
+        # Lines still queued go to the previous build's log file; then start afresh
+        self.log_sink.drain()
         self.log_textbox.configure(state="normal")
         self.log_textbox.delete("0.0", "end")
         self.log_textbox.configure(state="disabled")
+        self.log_label.configure(text="Output Log")
+        self.log_sink.reset(os.path.join(self.builder.out_dir, LOG_FILE))
 
-        profile = self.profiles.get(self.profile_menu.get())
-        self.builder = cmpile.CmpileBuilder(log_callback=self.log_message, profile=profile)
-
-        thread = threading.Thread(target=self.run_build_process, args=(selected_files, flags, clean))
+        self.watch_stop = threading.Event()
+        thread = threading.Thread(target=self.run_build_process, args=(selected_files, flags, clean, jobs, keep_going, watch, use_server, variant, profile_run))
         thread.start()
 
-    def run_build_process(self, files, flags, clean):
+    def run_build_process(self, files, flags, clean, jobs=None, keep_going=False, watch=False, use_server=False, variant=None, profile_run=False):
         try:
-            self.builder.build_and_run(files, compiler_flags=flags, clean=clean, run=True)
+            if use_server and not watch:
+                result = build_server.request_build(files, self.log_message, profile=self.builder.profile,
+                                                    compiler_flags=flags, clean=clean, run=True,
+                                                    jobs=jobs, keep_going=keep_going, variant=variant,
+                                                    profile_run=profile_run)
+                if result is not None:
+                    return
+                self.log_message("No build server is running; building locally.")
+
+            if watch:
+                # Keeps rebuilding on save until the Watch box is unticked
+                self.builder.watch(files, stop_event=self.watch_stop, compiler_flags=flags, clean=clean,
+                                   run=True, jobs=jobs, keep_going=keep_going, variant=variant, profile_run=profile_run)
+            else:
+                self.builder.build_and_run(files, compiler_flags=flags, clean=clean, run=True,
+                                           jobs=jobs, keep_going=keep_going, variant=variant, profile_run=profile_run)
         except Exception as e:
             self.log_message(f"A critical error occurred: {e}", "error")
         finally:
             self.after(0, lambda: self.build_btn.configure(state="normal"))
 
+    def toggle_watch(self):
+        if self.watch_checkbox.get() == 0:
+            self.watch_stop.set()
+
     def quit(self):
+        self.watch_stop.set()
+        self.log_sink.close()
         self.destroy()
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+import os
+import queue
+
+class LogSink:
+    """
+    Buffers log lines between build threads and a UI that shows at most
+    max_lines of them.
+
+    write() is cheap and thread-safe; the UI calls drain() on its own thread
+    at a fixed tick and appends the returned text in one go. Every line is
+    also appended to spill_path (if set), so nothing is lost when the view
+    trims old lines; `dropped` counts the lines the view no longer shows.
+    """
+    def __init__(self, max_lines=5000, spill_path=None):
+        self.max_lines = max_lines
+        self._queue = queue.SimpleQueue()
+        self._spill = None
+        self.reset(spill_path)
+
+    def reset(self, spill_path=None):
+        """Starts over with an empty view, e.g. when the UI clears its log."""
+        self.close()
+        self.spill_path = spill_path
+        self.shown = 0
+        self.dropped = 0
+
+    def write(self, message, style=""):
+        self._queue.put(message)
+
+    def _spill_lines(self, lines):
+        if not self.spill_path:
+            return
+        try:
+            if self._spill is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+                self._spill = open(self.spill_path, 'w', encoding='utf-8', errors='replace')
+            self._spill.write("\n".join(lines) + "\n")
+            self._spill.flush()
+        except OSError:
+            # Keep the UI log working even if the file can't be written
+            self.spill_path = None
+
+    def drain(self):
+        """
+        Takes everything written since the last call. Returns (text, trim):
+        text to append to the view (None if nothing new) and the number of
+        lines to delete from the top of the view to stay within max_lines.
+        """
+        lines = []
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            lines.extend(message.splitlines() or [""])
+        if not lines:
+            return None, 0
+
+        self._spill_lines(lines)
+        if len(lines) > self.max_lines:
+            self.dropped += len(lines) - self.max_lines
+            lines = lines[-self.max_lines:]
+        trim = min(self.shown, max(0, self.shown + len(lines) - self.max_lines))
+        self.dropped += trim
+        self.shown += len(lines) - trim
+        return "\n".join(lines) + "\n", trim
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
@@ -0,0 +1,247 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import subprocess
+
+import build_state
+
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2 GiB
+STATS_FILE = "stats.json"
+
+# Bumped whenever the key layout changes, so old entries are never reused
+KEY_VERSION = "2"
+
+# What GCC and clang look for next to an -include'd header
+PCH_EXTENSIONS = (".gch", ".pch")
+
+def _preprocess_command(cmd, obj_path):
+    """
+    Turns a compile command into one that writes the preprocessed source to
+    stdout. The -MMD -MF options are kept, so the depfile is still produced
+    for the build manifest even when the object comes from the cache.
+    """
+    pp = []
+    skip = False
+    for arg in cmd:
+        if skip:
+            skip = False
+            continue
+        if arg == "-c":
+            continue
+        if arg == "-o":
+            skip = True
+            continue
+        pp.append(arg)
+    return pp[:1] + ["-E", "-MT", obj_path] + pp[1:]
+
+def _strip_line_markers(text):
+    """Drops '# <line> "file"' markers so the same file in two directories hashes the same."""
+    return "\n".join(line for line in text.splitlines() if not line.startswith("# "))
+
+class ObjectCache:
+    """
+    Content-addressed cache of compiled objects shared by every project.
+    Entries are keyed on the preprocessed source, the compiler identity,
+    the compile flags and any precompiled header in use. Total size is bounded; when it grows past the limit
+    the least recently used entries are evicted.
+    """
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.stats_path = os.path.join(cache_dir, STATS_FILE)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._pending = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "size": 0}
+        self._pch_digests = {}
+
+    def _entry_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key + ".o")
+
+    def _pch_digest(self, path):
+        """
+        SHA-256 of a precompiled header, remembered per size and mtime so a
+        build hashes it once rather than once per TU.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._pch_digests.get(stamp)
+        if digest is None:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            digest = digest.hexdigest()
+            with self._lock:
+                self._pch_digests[stamp] = digest
+        return digest
+
+    def _pch_digests_for(self, cmd, cwd):
+        """
+        Digests of the precompiled headers the compiler would use for the
+        -include'd headers of cmd. Preprocessing may read the PCH instead of
+        the header text, so its content has to be part of the key.
+        """
+        digests = []
+        for flag, header in zip(cmd, cmd[1:]):
+            if flag != "-include":
+                continue
+            if cwd and not os.path.isabs(header):
+                header = os.path.join(cwd, header)
+            for extension in PCH_EXTENSIONS:
+                digest = self._pch_digest(header + extension)
+                if digest:
+                    digests.append(digest)
+        return digests
+
+    def compute_key(self, cmd, src, obj_path, dep_path, cwd=None):
+        """
+        Preprocesses the TU and returns its cache key, or None when the
+        source cannot be preprocessed (the real compile will then report the
+        error).
+        """
+        pp_cmd = _preprocess_command(cmd, obj_path)
+        try:
+            result = subprocess.run(pp_cmd, cwd=cwd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        except OSError:
+            return None
+        if result.returncode != 0:
+            return None
+
+        # Output paths differ per project and are not part of what gets compiled
+        placeholders = {src: "<src>", obj_path: "<obj>", dep_path: "<dep>"}
+        args = [placeholders.get(arg, arg) for arg in cmd[1:]]
+        # Debug info embeds file paths, so keep the line markers in that case
+        keep_markers = any(arg.startswith("-g") for arg in args)
+        text = result.stdout if keep_markers else _strip_line_markers(result.stdout)
+
+        h = hashlib.sha256()
+        h.update(KEY_VERSION.encode())
+        h.update(build_state.tool_identity(cmd[0]).encode("utf-8"))
+        h.update("\0".join(args).encode("utf-8"))
+        h.update(text.encode("utf-8"))
+        for digest in self._pch_digests_for(cmd, cwd):
+            h.update(digest.encode("utf-8"))
+        return h.hexdigest()
+
+    def fetch(self, key, obj_path):
+        """
+        Copies a cached object to obj_path.
+        Returns the compiler's original stderr (warnings) on a hit, else None.
+        """
+        entry = self._entry_path(key)
+        try:
+            shutil.copyfile(entry, obj_path)
+            # Refresh the entry's mtime; eviction drops the oldest first
+            os.utime(entry, None)
+        except OSError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        try:
+            with open(entry + ".stderr", 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def store(self, key, obj_path, stderr=""):
+        entry = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            if stderr:
+                with open(entry + ".stderr", 'w', encoding='utf-8') as f:
+                    f.write(stderr)
+            tmp_path = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(obj_path, tmp_path)
+            os.replace(tmp_path, entry)
+        except OSError:
+            return
+        with self._lock:
+            self._pending["stores"] += 1
+            self._pending["size"] += os.path.getsize(entry)
+
+    def _count(self, field):
+        with self._lock:
+            self._pending[field] += 1
+
+    def _load_stats(self):
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_stats(self, stats):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=1)
+        os.replace(tmp_path, self.stats_path)
+
+    def flush(self):
+        """Merges this session's counters into the on-disk stats and enforces the size limit."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {field: 0 for field in pending}
+        if not any(pending.values()):
+            return
+
+        stats = self._load_stats()
+        for field, value in pending.items():
+            stats[field] = stats.get(field, 0) + value
+        if stats.get("size", 0) > self.max_size:
+            stats["size"], evicted = self._evict()
+            stats["evictions"] = stats.get("evictions", 0) + evicted
+        self._write_stats(stats)
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.objects_dir):
+            return entries
+        for root, _, names in os.walk(self.objects_dir):
+            for name in names:
+                if not name.endswith(".o"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache is at 90% of its limit."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_size * 0.9
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            if os.path.exists(path + ".stderr"):
+                os.remove(path + ".stderr")
+            total -= size
+            evicted += 1
+        return total, evicted
+
+    def stats(self):
+        stats = self._load_stats()
+        entries = self._entries()
+        stats["entries"] = len(entries)
+        stats["size"] = sum(size for _, size, _ in entries)
+        stats["max_size"] = self.max_size
+        return stats
+
+    def clear(self):
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
@@ -1,66 +1,357 @@
-import re
-
-# Simple mapping of common headers to vcpkg package names
-# This is non-exhaustive and will need updates.
-HEADER_MAPPING = {
-    "nlohmann/json.hpp": "nlohmann-json",
-    "fmt/core.h": "fmt",
-    "fmt/format.h": "fmt",
-    "spdlog/spdlog.h": "spdlog",
-    "sqlite3.h": "sqlite3",
-    "curl/curl.h": "curl",
-    "gtest/gtest.h": "gtest",
-    "GL/glew.h": "glew",
-    "GLFW/glfw3.h": "glfw3",
-    "glm/glm.hpp": "glm",
-    "zlib.h": "zlib",
-    "openssl/ssl.h": "openssl",
-    "boost/asio.hpp": "boost-asio", # Boost is modular in vcpkg
-    # Add more as needed
-}
-
-def find_includes(file_path):
-    """
-    Scans a C/C++ file for #include directives.
-    Returns a set of included files (strings).
-    """
-    includes = set()
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                # Regex for #include <path> or #include "path"
-                match = re.search(r'^\s*#include\s*[<"]([^>"]+)[>"]', line)
-                if match:
-                    includes.add(match.group(1))
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-    return includes
-
-def map_includes_to_packages(includes):
-    """
-    Maps a list of include paths to potential vcpkg package names.
-    Returns a set of package names.
-    """
-    packages = set()
-    for inc in includes:
-        # Check exact match in mapping
-        if inc in HEADER_MAPPING:
-            packages.add(HEADER_MAPPING[inc])
-            continue
-        
-        # Check heuristics
-        # Logic: if include is "foo/bar.h", try mapping "foo" if it's not standard
-        # Identifying standard libs is hard without a list, but we can try ignoring them?
-        # For now, minimal heuristics to avoid false positives on std libs (iostream, vector, etc)
-        # Assuming vcpkg packages usually live in subdirs or have known headers.
-        
-        # We can detect if it looks like a library (has a slash)
-        if '/' in inc:
-            parts = inc.split('/')
-            root = parts[0]
-            # Try to map the root folder if it matches a known pattern?
-            # actually commonly libs match the folder name: generic usage
-            # but let's be conservative and only use the explicit map for now unless requested otherwise.
-            pass
-            
-    return packages
+import os
+import re
+import json
+from collections import namedtuple
+
+# Simple mapping of common headers to vcpkg package names
+# This is non-exhaustive and will need updates.
+HEADER_MAPPING = {
+    "nlohmann/json.hpp": "nlohmann-json",
+    "fmt/core.h": "fmt",
+    "fmt/format.h": "fmt",
+    "spdlog/spdlog.h": "spdlog",
+    "sqlite3.h": "sqlite3",
+    "curl/curl.h": "curl",
+    "gtest/gtest.h": "gtest",
+    "GL/glew.h": "glew",
+    "GLFW/glfw3.h": "glfw3",
+    "glm/glm.hpp": "glm",
+    "zlib.h": "zlib",
+    "openssl/ssl.h": "openssl",
+    "boost/asio.hpp": "boost-asio", # Boost is modular in vcpkg
+    # Add more as needed
+}
+
+INCLUDE_RE = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]')
+DEFINE_RE = re.compile(r'^\s*#\s*(define|undef|ifndef)\s+(\w+)')
+
+# One #include directive: the name as written, whether it used <...>,
+# and the file it resolved to inside the project (None for system/package headers)
+Include = namedtuple("Include", ["name", "angled", "path"])
+
+def map_includes_to_packages(includes, index=None):
+    """
+    Maps a list of include paths to potential vcpkg package names.
+    Uses the HeaderIndex built from the vcpkg tree when one is given,
+    otherwise only the hand-written HEADER_MAPPING.
+    Returns a set of package names.
+    """
+    packages = set()
+    for inc in includes:
+        # Check exact match in mapping
+        if inc in HEADER_MAPPING:
+            packages.add(HEADER_MAPPING[inc])
+            continue
+
+        if index is not None:
+            port = index.lookup(inc)
+            if port:
+                packages.add(port)
+
+    return packages
+
+# Directory names that belong to the C library / OS headers, never to a port
+SYSTEM_PREFIXES = {"sys", "bits", "linux", "asm", "asm-generic", "arpa", "net", "netinet", "machine", "mach"}
+
+# Trie match strengths, strongest first
+RANK_MAPPING = 0    # HEADER_MAPPING entry
+RANK_INSTALLED = 1  # file listed by an installed port
+RANK_PREFIX = 2     # directory owned by exactly one installed port
+RANK_PORT = 3       # guessed from a port name (foo/ -> foo, foo/bar -> foo-bar)
+
+INDEX_VERSION = 2
+
+# Trie node keys for "a port owns this directory" / "a port owns this file";
+# they contain a NUL so they never clash with a path component
+_DIR = "\0dir"
+_FILE = "\0file"
+
+class HeaderIndex:
+    """
+    Maps header paths and directory prefixes to vcpkg port names.
+    Built from the vcpkg tree: port names from ports/*/vcpkg.json and the
+    exact header lists from installed/vcpkg/info/*.list. The source data
+    and the trie built from it are persisted; refresh() only rereads the
+    .list files whose size or mtime changed and rebuilds the trie only
+    when something did. Lookups walk a trie of path components, so they
+    cost a few dict lookups regardless of how many headers are indexed.
+    """
+    def __init__(self, vcpkg_root, index_path=None):
+        self.vcpkg_root = vcpkg_root
+        self.index_path = index_path
+        self.ports = {"mtime_ns": None, "names": []}
+        self.lists = {}
+        self.trie = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, vcpkg_root, index_path=None):
+        """Loads the persisted index, refreshes whatever changed and saves it back."""
+        index = cls(vcpkg_root, index_path)
+        if index_path:
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION and data.get("vcpkg_root") == vcpkg_root:
+                    index.ports = data["ports"]
+                    index.lists = data["lists"]
+                    # A trie built from an older HEADER_MAPPING is rebuilt
+                    if data.get("mapping") == HEADER_MAPPING:
+                        index.trie = data["trie"]
+            except (OSError, ValueError, KeyError):
+                pass
+        index.refresh()
+        index.save()
+        return index
+
+    def refresh(self):
+        ports_dir = os.path.join(self.vcpkg_root, "ports")
+        try:
+            mtime_ns = os.stat(ports_dir).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns != self.ports["mtime_ns"]:
+            names = []
+            if mtime_ns is not None:
+                for entry in os.scandir(ports_dir):
+                    if entry.is_dir() and os.path.exists(os.path.join(entry.path, "vcpkg.json")):
+                        names.append(entry.name)
+            self.ports = {"mtime_ns": mtime_ns, "names": sorted(names)}
+            self.dirty = True
+
+        info_dir = os.path.join(self.vcpkg_root, "installed", "vcpkg", "info")
+        seen = set()
+        if os.path.isdir(info_dir):
+            for entry in os.scandir(info_dir):
+                if not entry.name.endswith(".list"):
+                    continue
+                seen.add(entry.name)
+                st = entry.stat()
+                cached = self.lists.get(entry.name)
+                if cached and cached["mtime_ns"] == st.st_mtime_ns and cached.get("size") == st.st_size:
+                    continue
+                self.lists[entry.name] = {
+                    # <port>_<version>_<triplet>.list; port names never contain '_'
+                    "port": entry.name.split("_")[0],
+                    "mtime_ns": st.st_mtime_ns,
+                    "size": st.st_size,
+                    "headers": _headers_from_list(entry.path),
+                }
+                self.dirty = True
+        for name in list(self.lists):
+            if name not in seen:
+                del self.lists[name]
+                self.dirty = True
+
+        if self.dirty or not self.trie:
+            self._build_trie()
+            self.dirty = True
+
+    def _build_trie(self):
+        self.trie = {}
+        for name in self.ports["names"]:
+            self._insert(name + "/", name, RANK_PORT)
+            if "-" in name:
+                # boost-asio owns boost/asio/ and boost/asio.hpp
+                nested = name.replace("-", "/", 1)
+                self._insert(nested + "/", name, RANK_PORT)
+                self._insert(nested, name, RANK_PORT)
+
+        owners = {}
+        for info in self.lists.values():
+            for header in info["headers"]:
+                self._insert(header, info["port"], RANK_INSTALLED)
+                if "/" in header:
+                    owners.setdefault(header.split("/", 1)[0], set()).add(info["port"])
+        for directory, ports in owners.items():
+            if len(ports) == 1:
+                self._insert(directory + "/", next(iter(ports)), RANK_PREFIX)
+
+        for header, port in HEADER_MAPPING.items():
+            self._insert(header, port, RANK_MAPPING)
+
+    def _insert(self, path, port, rank):
+        """Inserts a header path, or a directory prefix when path ends in '/'."""
+        parts = [p for p in path.split("/") if p]
+        if not parts or parts[0] in SYSTEM_PREFIXES:
+            return
+        node = self.trie
+        for part in parts:
+            node = node.setdefault(part, {})
+        key = _DIR if path.endswith("/") else _FILE
+        current = node.get(key)
+        if current is None or rank < current[1]:
+            node[key] = (port, rank)
+
+    def lookup(self, include):
+        """
+        Returns the port providing an include path, or None.
+        An exact file entry wins; otherwise the deepest directory prefix
+        that a port owns. For the last component the extension-less stem is
+        also tried, so boost/asio.hpp matches the boost/asio entry.
+        """
+        parts = include.split("/")
+        node = self.trie
+        best = None
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            if last and i > 0:
+                stem = node.get(os.path.splitext(part)[0])
+                if stem and _FILE in stem and (best is None or stem[_FILE][1] <= best[1]):
+                    best = stem[_FILE]
+            node = node.get(part)
+            if node is None:
+                break
+            if last and _FILE in node:
+                return node[_FILE][0]
+            if not last and _DIR in node:
+                if best is None or node[_DIR][1] <= best[1]:
+                    best = node[_DIR]
+        return best[0] if best else None
+
+    def save(self):
+        if not self.index_path or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": INDEX_VERSION, "vcpkg_root": self.vcpkg_root,
+                       "ports": self.ports, "lists": self.lists,
+                       "mapping": HEADER_MAPPING, "trie": self.trie}, f)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+def _headers_from_list(list_path):
+    """Returns the include-relative header paths in a vcpkg info .list file."""
+    headers = []
+    try:
+        with open(list_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                # Lines look like "x64-mingw-dynamic/include/fmt/core.h"
+                parts = line.strip().split("/", 2)
+                if len(parts) == 3 and parts[1] == "include" and not parts[2].endswith("/") and parts[2]:
+                    headers.append(parts[2])
+    except OSError:
+        pass
+    return headers
+
+def _scan_directives(file_path):
+    """
+    Returns (includes, first_define): the [angled, name] pairs of every
+    #include in a file, in order, and how many of them come before the
+    first #define or #undef (None without one). The #define of an
+    include guard right after its #ifndef does not count.
+    """
+    directives = []
+    first_define = None
+    guard = None
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = INCLUDE_RE.match(line)
+            if match:
+                directives.append([match.group(1) == '<', match.group(2)])
+                guard = None
+                continue
+            match = DEFINE_RE.match(line)
+            if match:
+                kind, macro = match.groups()
+                if kind != "ifndef" and macro != guard and first_define is None:
+                    first_define = len(directives)
+                guard = macro if kind == "ifndef" else None
+            elif line.lstrip().startswith("#"):
+                guard = None
+    return directives, first_define
+
+class IncludeScanner:
+    """
+    Follows quoted includes from the given sources through the project's own
+    headers and builds the full include graph.
+    Each file's directive list (and where its first #define is) is cached
+    on disk keyed by path, size and mtime, so only files that changed since the last build are read again.
+    """
+    def __init__(self, cache_path=None, include_dirs=None, log_func=None):
+        self.cache_path = cache_path
+        self.log_func = log_func
+        self.include_dirs = [os.path.abspath(d) for d in (include_dirs or [])]
+        self.cache = {}
+        self.dirty = False
+        self.rescanned = 0
+        if cache_path:
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    self.cache = json.load(f)
+            except (OSError, ValueError):
+                self.cache = {}
+
+    def directives(self, file_path):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return []
+        entry = self.cache.get(file_path)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns and "first_define" in entry:
+            return entry["includes"]
+
+        try:
+            includes, first_define = _scan_directives(file_path)
+        except OSError as e:
+            if self.log_func:
+                self.log_func(f"Error reading {file_path}: {e}", "bold red")
+            includes, first_define = [], None
+        self.cache[file_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                 "includes": includes, "first_define": first_define}
+        self.dirty = True
+        self.rescanned += 1
+        return includes
+
+    def first_define(self, file_path):
+        """How many #includes of a file come before its first #define/#undef, or None."""
+        self.directives(file_path)
+        entry = self.cache.get(file_path)
+        return entry["first_define"] if entry else None
+
+    def resolve(self, name, angled, including_file):
+        """Finds a header inside the project; quoted includes also search the including file's folder."""
+        search = self.include_dirs
+        if not angled:
+            search = [os.path.dirname(including_file)] + search
+        for directory in search:
+            candidate = os.path.normpath(os.path.join(directory, name))
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def scan(self, files):
+        """
+        Returns the include graph reachable from files as
+        {absolute path: [Include, ...]}, visiting every file once.
+        """
+        graph = {}
+        self.rescanned = 0
+        stack = [os.path.abspath(f) for f in files]
+        while stack:
+            current = stack.pop()
+            if current in graph:
+                continue
+            records = []
+            for angled, name in self.directives(current):
+                path = self.resolve(name, angled, current)
+                records.append(Include(name, angled, path))
+                if path and path not in graph:
+                    stack.append(path)
+            graph[current] = records
+        return graph
+
+    def save(self):
+        if not self.cache_path or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f)
+        os.replace(tmp_path, self.cache_path)
+        self.dirty = False
+
+def external_includes(graph):
+    """Returns the include names in a graph that did not resolve to a project file."""
+    return {inc.name for records in graph.values() for inc in records if inc.path is None}
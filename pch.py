@@ -0,0 +1,169 @@
+import os
+import subprocess
+
+import build_state
+import package_finder
+
+PCH_DIR = "pch"
+PCH_HEADER = "cmpile_pch.hpp"
+
+# A header has to be reachable from at least this share of the C++ TUs
+# (and from two of them) before it is worth precompiling
+MIN_SHARE = 0.5
+# Once chosen, headers stay in the PCH while this share of the TUs still
+# reaches them, so adding or removing a file doesn't change every command
+KEEP_SHARE = 0.25
+
+def _external_includes(graph, src):
+    """Returns the system/package includes reachable from src through project headers."""
+    found = set()
+    seen = set()
+    stack = [src]
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        for inc in graph.get(current, []):
+            if inc.path:
+                stack.append(inc.path)
+            elif inc.angled:
+                found.add(inc.name)
+    return found
+
+# Standard headers that are expensive to parse. Cheap ones such as
+# <cstdint> or <utility> would only make the PCH larger without saving time.
+HEAVY_STD_HEADERS = {
+    "algorithm", "any", "array", "atomic", "bitset", "chrono", "codecvt",
+    "complex", "condition_variable", "deque", "filesystem", "format",
+    "fstream", "functional", "future", "iomanip", "ios", "iostream",
+    "istream", "locale", "map", "memory", "mutex", "numeric", "optional",
+    "ostream", "queue", "random", "ranges", "regex", "set", "shared_mutex",
+    "sstream", "stack", "string", "string_view", "thread",
+    "tuple", "unordered_map", "unordered_set", "valarray", "variant",
+    "vector",
+}
+
+def is_heavy(include, index=None):
+    """
+    True for headers worth precompiling: headers that belong to a vcpkg
+    package, and the expensive C++ standard library headers.
+    """
+    if include in HEAVY_STD_HEADERS or include in package_finder.HEADER_MAPPING:
+        return True
+    return index is not None and bool(index.lookup(include))
+
+def defines_before_pch(graph, scanner, src, headers):
+    """
+    True when src has a #define or #undef (in itself or in a project
+    header it includes) before its first include of one of the PCH's
+    headers. -include puts the PCH ahead of that macro, so the TU would
+    see those headers configured differently than it asked for.
+    """
+    headers = set(headers)
+    seen = set()
+    defined = False
+
+    def walk(path):
+        nonlocal defined
+        seen.add(path)
+        first_define = scanner.first_define(path)
+        records = graph.get(path, [])
+        for i, inc in enumerate(records):
+            if first_define is not None and first_define <= i:
+                defined = True
+            if inc.angled and inc.name in headers:
+                return defined
+            if inc.path and inc.path not in seen:
+                found = walk(inc.path)
+                if found is not None:
+                    return found
+        if first_define is not None:
+            defined = True
+        return None
+
+    return bool(walk(os.path.abspath(src)))
+
+def current_headers(out_dir):
+    """The headers of the PCH generated by an earlier build, or None."""
+    try:
+        with open(os.path.join(out_dir, PCH_DIR, PCH_HEADER), 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    return [line[len("#include <"):-1] for line in lines if line.startswith("#include <") and line.endswith(">")]
+
+def select_headers(graph, sources, index=None, previous=None):
+    """
+    Picks the heavy headers shared by many of the given C++ sources.
+    Returns a sorted list of include names, empty when a PCH is not worth it.
+
+    The previous selection is kept as long as each of its headers is still
+    reached by KEEP_SHARE of the sources, even if the MIN_SHARE choice
+    would now differ: changing the PCH recompiles every C++ file.
+    """
+    cpp_sources = [src for src in sources if src.lower().endswith(build_state.CPP_EXTENSIONS)]
+    if len(cpp_sources) < 2:
+        return []
+
+    counts = {}
+    for src in cpp_sources:
+        for include in _external_includes(graph, src):
+            if is_heavy(include, index):
+                counts[include] = counts.get(include, 0) + 1
+
+    if previous:
+        keep = max(1, int(len(cpp_sources) * KEEP_SHARE + 0.5))
+        if all(counts.get(include, 0) >= keep for include in previous):
+            return sorted(previous)
+
+    needed = max(2, int(len(cpp_sources) * MIN_SHARE + 0.5))
+    return sorted(include for include, count in counts.items() if count >= needed)
+
+def prepare(out_dir, headers, compiler, flags, state, log_func, force=False, cwd=None):
+    """
+    Generates out/pch/cmpile_pch.hpp for the given headers and precompiles it
+    with the same flags the TUs use. The PCH is only rebuilt when the
+    header list, one of the headers, the flags or the compiler changed.
+
+    Returns (include_flags, pch_binary) to add to every C++ compile, or
+    ([], None) when there is nothing to precompile or precompiling failed.
+    """
+    pch_dir = os.path.join(out_dir, PCH_DIR)
+    if not headers:
+        # Forget the old selection, so the next build chooses afresh
+        header_path = os.path.join(pch_dir, PCH_HEADER)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+        return [], None
+
+    os.makedirs(pch_dir, exist_ok=True)
+    header_path = os.path.abspath(os.path.join(pch_dir, PCH_HEADER))
+    build_state.write_if_changed(header_path, "".join(f"#include <{h}>\n" for h in headers))
+
+    # GCC picks up foo.hpp.gch and clang foo.hpp.pch for -include foo.hpp
+    extension = ".pch" if "clang" in os.path.basename(compiler) else ".gch"
+    pch_binary = header_path + extension
+    dep_path = build_state.depfile_path_for(pch_binary)
+
+    # -MD rather than -MMD: standard and vcpkg headers are the whole point here
+    cmd = [compiler, "-x", "c++-header", header_path, "-o", pch_binary, "-MD", "-MF", dep_path] + flags
+    reason = "clean build" if force else state.needs_rebuild(pch_binary, cmd)
+    if reason:
+        log_func(f"Precompiling {len(headers)} shared header(s) ({reason})...")
+        try:
+            result = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        except OSError as e:
+            log_func(f"Precompiled header skipped: {e}", "bold red")
+            return [], None
+        if result.returncode != 0:
+            state.forget(pch_binary)
+            log_func("Precompiled header failed; compiling without it.", "bold red")
+            if result.stderr:
+                log_func(result.stderr, "bold red")
+            return [], None
+        state.record(pch_binary, cmd)
+    else:
+        log_func(f"Precompiled header is up to date ({len(headers)} header(s))")
+
+    return ["-include", header_path, "-Winvalid-pch"], pch_binary
@@ -0,0 +1,127 @@
+import re
+import collections
+
+# How many functions the report lists
+TOP_FUNCTIONS = 15
+# Callers followed when rebuilding stacks from gprof's call graph
+MAX_STACK_DEPTH = 64
+
+PERF_FRAME_RE = re.compile(r"^\s+[0-9a-fA-F]+\s+(.+?)(?:\s+\((.*)\))?$")
+GPROF_FLAT_RE = re.compile(r"^\s*([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+(?:(\d+)\s+([\d.]+)\s+([\d.]+)\s+)?(.+?)\s*$")
+GPROF_PRIMARY_RE = re.compile(r"^\[\d+\]\s+[\d.]+\s+([\d.]+)\s+([\d.]+)\s+(?:[\d+]+\s+)?(.+?)\s+\[\d+\]$")
+GPROF_ARC_RE = re.compile(r"^\s+([\d.]+)\s+([\d.]+)\s+(\d+)(?:\+\d+)?(?:/\d+)?\s+(.+?)\s+\[\d+\]$")
+
+def _symbol(raw):
+    # "work(int)+0x1a" -> "work(int)"
+    return re.sub(r"\+0x[0-9a-fA-F]+$", "", raw.strip()) or "[unknown]"
+
+def parse_perf_script(text):
+    """
+    Reads `perf script` output into {stack: samples}, each stack a tuple
+    of function names from the outermost caller to the sampled function,
+    starting with the command name.
+    """
+    stacks = collections.Counter()
+    command, frames = None, []
+    def flush():
+        if command is not None and frames:
+            stacks[tuple([command] + frames[::-1])] += 1
+    for line in text.splitlines():
+        if not line.strip():
+            flush()
+            command, frames = None, []
+        elif line[0].isspace():
+            match = PERF_FRAME_RE.match(line)
+            if match and command is not None:
+                frames.append(_symbol(match.group(1)))
+        else:
+            flush()
+            command, frames = line.split()[0], []
+    flush()
+    return stacks
+
+def self_time(stacks):
+    """{function: weight} of the innermost frame of every stack."""
+    totals = collections.Counter()
+    for stack, weight in stacks.items():
+        totals[stack[-1]] += weight
+    return totals
+
+def parse_gprof_flat(text):
+    """
+    Reads gprof's flat profile (-p). Returns [(function, self seconds,
+    percent of time, calls or None)], slowest first.
+    """
+    rows = []
+    in_table = False
+    for line in text.splitlines():
+        if line.strip().startswith("time") and "name" in line:
+            in_table = True
+            continue
+        if not in_table:
+            continue
+        if not line.strip():
+            break
+        match = GPROF_FLAT_RE.match(line)
+        if match:
+            calls = int(match.group(4)) if match.group(4) else None
+            rows.append((match.group(7), float(match.group(3)), float(match.group(1)), calls))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows
+
+def parse_gprof_call_graph(text):
+    """
+    Reads gprof's call graph (-q) into ({function: self seconds},
+    {function: {caller: calls}}).
+    """
+    self_seconds, callers = {}, {}
+    for block in text.split("-----------------------------------------------"):
+        parents, primary = [], None
+        for line in block.splitlines():
+            if line.startswith("["):
+                match = GPROF_PRIMARY_RE.match(line)
+                if match:
+                    primary = re.sub(r"\s*<cycle \d+>$", "", match.group(3))
+                    self_seconds[primary] = float(match.group(1))
+            elif primary is None:
+                match = GPROF_ARC_RE.match(line)
+                if match:
+                    parents.append((re.sub(r"\s*<cycle \d+>$", "", match.group(4)), int(match.group(3))))
+        if primary is not None:
+            callers[primary] = {name: calls for name, calls in parents if name != primary}
+    return self_seconds, callers
+
+def gprof_stacks(self_seconds, callers):
+    """
+    Rebuilds approximate stacks from gprof's caller/callee arcs, splitting
+    each function's self time between its callers by call count (gprof's
+    own assumption). Weights are microseconds.
+    """
+    stacks = collections.Counter()
+    def walk(chain, weight):
+        parents = callers.get(chain[0]) or {}
+        parents = {name: calls for name, calls in parents.items() if name not in chain}
+        total = sum(parents.values())
+        # Stop splitting once a share is below a microsecond, so wide graphs stay cheap
+        if not total or len(chain) >= MAX_STACK_DEPTH or weight < 1.0:
+            stacks[tuple(chain)] += weight
+            return
+        for name, calls in parents.items():
+            walk([name] + chain, weight * calls / total)
+    for function, seconds in self_seconds.items():
+        if seconds > 0:
+            walk([function], seconds * 1e6)
+    return collections.Counter({stack: round(weight) for stack, weight in stacks.items() if round(weight) > 0})
+
+def write_collapsed(path, stacks):
+    """Writes stacks in the folded format flamegraph.pl and speedscope read: "a;b;c weight"."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, weight in sorted(stacks.items()):
+            f.write(";".join(name.replace(";", ":") for name in stack) + f" {weight}\n")
+
+def report_top(rows, log_func, limit=TOP_FUNCTIONS):
+    """Logs [(function, self time as text, percent, calls or None)] as a table."""
+    log_func("Top functions by self time:")
+    log_func(f"  {'self':>10} {'%':>6} {'calls':>10}  function")
+    for name, self_text, percent, calls in rows[:limit]:
+        log_func(f"  {self_text:>10} {percent:>5.1f}% {calls if calls is not None else '':>10}  {name}")
@@ -0,0 +1,111 @@
+import os
+import json
+import math
+import time
+import statistics
+
+HISTORY_FILE = "bench_history.json"
+# Entries kept per program
+MAX_HISTORY = 50
+# A slowdown is only reported when it is this unlikely to be noise...
+REGRESSION_ALPHA = 0.05
+# ...and the median got at least this much slower
+MIN_SLOWDOWN = 0.03
+# Fewer runs than this on either side can't show a significant difference
+MIN_SAMPLES = 5
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(results):
+    """min/median/p95 wall time and the largest peak RSS of a list of RunResults."""
+    walls = [r.wall for r in results]
+    rss = [r.peak_rss_kb for r in results if r.peak_rss_kb is not None]
+    return {
+        "runs": len(walls),
+        "min": min(walls),
+        "median": statistics.median(walls),
+        "p95": percentile(walls, 0.95),
+        "peak_rss_kb": max(rss) if rss else None,
+        "walls": walls,
+    }
+
+def mann_whitney_p(a, b):
+    """
+    Two-sided p-value of the Mann-Whitney U test (normal approximation with
+    tie correction): how likely samples this different are if a and b
+    come from the same distribution. Makes no assumption about the shape
+    of the distributions, which suits skewed run times.
+    """
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        return 1.0
+    combined = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    n = n1 + n2
+    rank_sum = 0.0
+    ties = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        count = j - i + 1
+        average_rank = (i + j) / 2 + 1
+        rank_sum += average_rank * sum(1 for k in range(i, j + 1) if combined[k][1] == 0)
+        ties += count ** 3 - count
+        i = j + 1
+    u = rank_sum - n1 * (n1 + 1) / 2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = max(0.0, abs(u - n1 * n2 / 2) - 0.5) / sigma
+    return math.erfc(z / math.sqrt(2))
+
+def compare(current, previous):
+    """
+    Compares two summaries. Returns (change, p_value, regressed): the
+    relative change of the median, the test's p-value (None with too few
+    runs) and whether that counts as a significant regression.
+    """
+    change = current["median"] / previous["median"] - 1 if previous["median"] else 0.0
+    if len(current["walls"]) < MIN_SAMPLES or len(previous["walls"]) < MIN_SAMPLES:
+        return change, None, False
+    p_value = mann_whitney_p(current["walls"], previous["walls"])
+    return change, p_value, p_value < REGRESSION_ALPHA and change > MIN_SLOWDOWN
+
+class History:
+    """
+    Benchmark results of a project's programs, kept in out/bench_history.json
+    and keyed by the program's path relative to the project, so every
+    variant has its own history.
+    """
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def previous(self, key, binary):
+        """The latest entry for a different build of the program, else the latest entry, else None."""
+        entries = self.entries.get(key, [])
+        for entry in reversed(entries):
+            if entry.get("binary") != binary:
+                return entry
+        return entries[-1] if entries else None
+
+    def add(self, key, binary, summary):
+        entry = dict(summary, binary=binary, time=time.time())
+        self.entries.setdefault(key, []).append(entry)
+        del self.entries[key][:-MAX_HISTORY]
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
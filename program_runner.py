@@ -0,0 +1,137 @@
+import time
+import tempfile
+import threading
+import subprocess
+import collections
+
+import build_trace
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+RunResult = collections.namedtuple("RunResult", "returncode wall cpu peak_rss_kb timed_out")
+
+def memory_limit_supported():
+    return resource is not None and hasattr(resource, "RLIMIT_AS")
+
+def _memory_limited(cmd, memory_limit_mb):
+    """
+    Returns (cmd, limit_bytes) for running cmd under an address-space cap.
+    Where resource.prlimit exists (Linux) cmd is unchanged and the caller
+    applies limit_bytes to the child right after spawning it, so Popen
+    needs no preexec_fn (which is unsafe with threads and disables the
+    fast spawn path). Elsewhere on POSIX cmd is wrapped in a shell that sets
+    `ulimit -v` and execs the program, and limit_bytes is None.
+    """
+    if not memory_limit_mb or not memory_limit_supported():
+        return cmd, None
+    limit = int(memory_limit_mb * 1024 * 1024)
+    if hasattr(resource, "prlimit"):
+        return cmd, limit
+    return ["/bin/sh", "-c", f'ulimit -v {limit // 1024} && exec "$@"', "sh"] + list(cmd), None
+
+def _limit_memory(proc, limit_bytes):
+    if limit_bytes is None:
+        return
+    try:
+        resource.prlimit(proc.pid, resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+    except (ProcessLookupError, PermissionError):
+        # Already exited; nothing left to limit
+        pass
+
+def _wait(proc, timeout):
+    """Waits for proc, killing it after timeout seconds. Returns (cpu, peak_rss_kb, timed_out)."""
+    timed_out = threading.Event()
+    def kill():
+        timed_out.set()
+        proc.kill()
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    try:
+        cpu, peak_rss = build_trace.wait_with_usage(proc)
+    finally:
+        if timer:
+            timer.cancel()
+    return cpu, peak_rss, timed_out.is_set()
+
+def _pump(stream, emit, style):
+    """Forwards a pipe line by line until the program closes it."""
+    with stream:
+        for line in stream:
+            line = line.rstrip()
+            if line:
+                emit(line, style)
+
+def run_program(cmd, log_func, cwd=None, env=None, timeout=None, memory_limit_mb=None, stdin=None):
+    """
+    Runs the built program and streams its output to log_func as it
+    arrives: stdout as normal lines, stderr in red. Both pipes are drained
+    on their own threads, so a program that fills one of them can't block.
+
+    The program is killed after `timeout` seconds of wall time. With
+    memory_limit_mb its address space is capped (POSIX only), so allocations
+    beyond it fail. Returns a RunResult; cpu and peak_rss_kb are None where
+    the platform can't measure them.
+    """
+    if memory_limit_mb and not memory_limit_supported():
+        log_func("Memory limits are not supported on this platform; running without one.", "bold red")
+    cmd, limit = _memory_limited(cmd, memory_limit_mb)
+
+    # Both reader threads log, so keep their lines from interleaving
+    lock = threading.Lock()
+    def emit(line, style=""):
+        with lock:
+            log_func(line, style)
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=stdin if stdin is not None else subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+                            encoding='utf-8', errors='replace')
+    _limit_memory(proc, limit)
+    readers = [threading.Thread(target=_pump, args=(proc.stdout, emit, ""), daemon=True),
+               threading.Thread(target=_pump, args=(proc.stderr, emit, "bold red"), daemon=True)]
+    for reader in readers:
+        reader.start()
+
+    cpu, peak_rss, timed_out = _wait(proc, timeout)
+    wall = time.perf_counter() - start
+    for reader in readers:
+        # A child of the program may still hold the pipes open; don't wait on it forever
+        reader.join(timeout=1.0)
+    return RunResult(proc.returncode, wall, cpu, peak_rss, timed_out)
+
+def measure_program(cmd, cwd=None, env=None, timeout=None, memory_limit_mb=None, stdout_path=None):
+    """
+    Runs the program once for timing, without streaming its output: stdout
+    is written to stdout_path (or discarded) and stderr is collected in a
+    temporary file, so neither pipe can stall the program or skew its time.
+    Returns (RunResult, stderr text).
+    """
+    with tempfile.TemporaryFile() as stderr_file:
+        stdout = open(stdout_path, 'wb') if stdout_path else subprocess.DEVNULL
+        cmd, limit = _memory_limited(cmd, memory_limit_mb)
+        try:
+            start = time.perf_counter()
+            proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=stdout, stderr=stderr_file)
+            _limit_memory(proc, limit)
+            cpu, peak_rss, timed_out = _wait(proc, timeout)
+            wall = time.perf_counter() - start
+        finally:
+            if stdout_path:
+                stdout.close()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode('utf-8', errors='replace')
+    return RunResult(proc.returncode, wall, cpu, peak_rss, timed_out), stderr
+
+def format_usage(result):
+    """One-line summary of a RunResult for the log."""
+    parts = [f"wall {result.wall * 1000:.1f} ms"]
+    if result.cpu is not None:
+        parts.append(f"cpu {result.cpu * 1000:.1f} ms")
+    if result.peak_rss_kb is not None:
+        parts.append(f"peak RSS {result.peak_rss_kb / 1024:.1f} MB")
+    return ", ".join(parts)
@@ -0,0 +1,125 @@
+import os
+import json
+import collections
+
+MANIFEST_FILE = "cmpile.json"
+
+TARGET_KINDS = ("exe", "lib")
+
+Target = collections.namedtuple("Target", "name kind sources deps")
+
+class ProjectError(Exception):
+    pass
+
+class Project:
+    """
+    A cmpile.json project: named executable ("exe") and static library
+    ("lib") targets, each with its sources and the targets it depends on.
+
+        {
+          "compiler_flags": "-O2 -Iinclude",
+          "targets": {
+            "core": {"type": "lib", "sources": ["src/core.cpp"]},
+            "app":  {"type": "exe", "sources": ["app/main.cpp"], "deps": ["core"]}
+          }
+        }
+
+    Source paths are relative to the folder holding the manifest.
+    """
+    def __init__(self, path, targets, compiler_flags=""):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.targets = targets
+        self.compiler_flags = compiler_flags
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except OSError as e:
+            raise ProjectError(f"Cannot read {path}: {e}")
+        except ValueError as e:
+            raise ProjectError(f"{path} is not valid JSON: {e}")
+
+        if not isinstance(data, dict):
+            raise ProjectError(f"{path} must contain a JSON object.")
+        specs = data.get("targets") or {}
+        if not isinstance(specs, dict):
+            raise ProjectError(f"{path}: \"targets\" must be an object mapping target names to targets.")
+        compiler_flags = data.get("compiler_flags", "")
+        if not isinstance(compiler_flags, str):
+            raise ProjectError(f"{path}: \"compiler_flags\" must be a string.")
+
+        root = os.path.dirname(os.path.abspath(path))
+        targets = {}
+        for name, spec in specs.items():
+            if not isinstance(spec, dict):
+                raise ProjectError(f"{path}: target '{name}' must be an object.")
+            kind = spec.get("type", "exe")
+            if kind not in TARGET_KINDS:
+                raise ProjectError(f"{path}: target '{name}' has unknown type '{kind}' (expected exe or lib).")
+            sources = spec.get("sources") or []
+            deps = spec.get("deps") or []
+            for field, value in (("sources", sources), ("deps", deps)):
+                if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                    raise ProjectError(f"{path}: \"{field}\" of target '{name}' must be a list of strings.")
+            if not sources:
+                raise ProjectError(f"{path}: target '{name}' has no sources.")
+            sources = [os.path.normpath(os.path.join(root, src)) for src in sources]
+            targets[name] = Target(name, kind, sources, list(deps))
+        if not targets:
+            raise ProjectError(f"{path} declares no targets.")
+
+        project = cls(path, targets, compiler_flags)
+        for target in targets.values():
+            for dep in target.deps:
+                if dep not in targets:
+                    raise ProjectError(f"Target '{target.name}' depends on unknown target '{dep}'.")
+                if targets[dep].kind != "lib":
+                    raise ProjectError(f"Target '{target.name}' depends on '{dep}', which is not a library.")
+        project.ordered()
+        return project
+
+    @staticmethod
+    def find(directory):
+        """Path of the manifest in directory, or None."""
+        path = os.path.join(directory, MANIFEST_FILE)
+        return path if os.path.exists(path) else None
+
+    def ordered(self, names=None):
+        """
+        The named targets plus everything they depend on, dependencies
+        first. All targets when names is empty. Raises ProjectError for
+        unknown names and dependency cycles.
+        """
+        for name in names or []:
+            if name not in self.targets:
+                raise ProjectError(f"Unknown target '{name}'. Targets: {', '.join(sorted(self.targets))}")
+        order = []
+        state = {}
+        def visit(name, chain):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ProjectError(f"Dependency cycle: {' -> '.join(chain + [name])}")
+            state[name] = "visiting"
+            for dep in self.targets[name].deps:
+                visit(dep, chain + [name])
+            state[name] = "done"
+            order.append(self.targets[name])
+        for name in names or self.targets:
+            visit(name, [])
+        return order
+
+    def link_libraries(self, target):
+        """
+        The libraries a target links against, transitively, in an order
+        suitable for the linker (each library before the ones it uses).
+        """
+        return [t for t in reversed(self.ordered([target.name])) if t.kind == "lib" and t.name != target.name]
+
+    @staticmethod
+    def sources(targets):
+        """The distinct sources of the given targets; shared files appear once."""
+        return list(dict.fromkeys(src for target in targets for src in target.sources))
@@ -0,0 +1,40 @@
+import time
+
+class Profile:
+    """Wall-clock time of each phase, measured from one mark to the next."""
+    def __init__(self):
+        self.phases = []
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """Records the time since the previous mark under the given phase name."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, log_func):
+        total = sum(duration for _, duration in self.phases)
+        width = max([len(phase) for phase, _ in self.phases] + [5])
+        log_func("Startup profile:")
+        for phase, duration in self.phases:
+            log_func(f"  {phase:<{width}}  {duration * 1000:8.1f} ms")
+        log_func(f"  {'total':<{width}}  {total * 1000:8.1f} ms")
+
+# The process's own startup, reported by --startup-profile.
+# Importing this module first starts the clock.
+_startup = Profile()
+
+def mark(phase):
+    if _startup is not None:
+        _startup.mark(phase)
+
+def take():
+    """
+    The profile started at import, for the first build of the process;
+    every later call gets a fresh one, so each build (watch mode, build
+    server) reports only its own phases.
+    """
+    global _startup
+    profile = _startup or Profile()
+    _startup = None
+    return profile
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+import http.server
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import download_script
+
+PAYLOAD = bytes(range(256)) * 1024  # 256 KB
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Serves PAYLOAD and honours single "bytes=a-b" ranges."""
+    ranges = True
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("Range"))
+        header = self.headers.get("Range")
+        if self.ranges and header and header.startswith("bytes="):
+            start, _, end = header[len("bytes="):].partition("-")
+            start, end = int(start), int(end) if end else len(PAYLOAD) - 1
+            body = PAYLOAD[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(PAYLOAD)}")
+        else:
+            body = PAYLOAD
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class NoRangeHandler(RangeHandler):
+    ranges = False
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cmpile-download-")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.target = os.path.join(self.root, "archive.zip")
+        self.log = []
+        patches = [
+            mock.patch.object(download_script, "CHECKSUMS_PATH", os.path.join(self.root, "checksums.json")),
+            mock.patch.object(download_script, "MIN_SEGMENT_SIZE", 64 * 1024),
+            mock.patch.object(download_script, "DOWNLOAD_CHUNK_SIZE", 16 * 1024),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def serve(self, handler):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.requests = []
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        return f"http://127.0.0.1:{server.server_port}/archive.zip"
+
+    def download(self, url, **kwargs):
+        download_script.download_file(url, self.target, log_func=lambda message, style="": self.log.append(message), **kwargs)
+
+    def read_target(self):
+        with open(self.target, 'rb') as f:
+            return f.read()
+
+    def test_ranged_download_uses_several_segments(self):
+        url = self.serve(RangeHandler)
+        self.download(url, segments=4)
+        self.assertEqual(self.read_target(), PAYLOAD)
+        segment_requests = [r for r in self.server.requests if r != "bytes=0-0"]
+        self.assertEqual(len(segment_requests), 4)
+        self.assertFalse(os.path.exists(self.target + ".part"))
+        self.assertFalse(os.path.exists(self.target + ".part.json"))
+
+    def test_interrupted_download_resumes(self):
+        url = self.serve(RangeHandler)
+        part_path = self.target + ".part"
+        # Two segments, the first finished and the second half way through
+        half = len(PAYLOAD) // 2
+        with open(part_path, 'wb') as f:
+            f.write(PAYLOAD[:half + half // 2])
+            f.truncate(len(PAYLOAD))
+        segments = [[0, half - 1, half], [half, len(PAYLOAD) - 1, half // 2]]
+        with open(part_path + ".json", 'w', encoding='utf-8') as f:
+            json.dump({"url": url, "size": len(PAYLOAD), "segments": segments}, f)
+
+        self.download(url, segments=2)
+        self.assertEqual(self.read_target(), PAYLOAD)
+        self.assertEqual(self.server.requests, ["bytes=0-0", f"bytes={half + half // 2}-{len(PAYLOAD) - 1}"])
+
+    def test_server_without_ranges_falls_back_to_one_connection(self):
+        url = self.serve(NoRangeHandler)
+        self.download(url, segments=4)
+        self.assertEqual(self.read_target(), PAYLOAD)
+        # The probe plus one plain request
+        self.assertEqual(self.server.requests, ["bytes=0-0", None])
+
+    def test_pinned_checksum_mismatch_fails(self):
+        url = self.serve(RangeHandler)
+        with self.assertRaises(download_script.DownloadError):
+            self.download(url, sha256="0" * 64)
+        self.assertFalse(os.path.exists(self.target))
+        self.assertFalse(os.path.exists(self.target + ".part"))
+
+    def test_first_checksum_is_recorded_and_enforced(self):
+        url = self.serve(RangeHandler)
+        self.download(url)
+        with open(download_script.CHECKSUMS_PATH, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {url: hashlib.sha256(PAYLOAD).hexdigest()})
+
+        os.remove(self.target)
+        download_script._record_checksum(url, "f" * 64)
+        with self.assertRaises(download_script.DownloadError):
+            self.download(url)
+        self.assertFalse(os.path.exists(self.target))
+
+if __name__ == "__main__":
+    unittest.main()
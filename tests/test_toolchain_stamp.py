@@ -0,0 +1,60 @@
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cmpile
+import download_script
+
+class ToolchainStampTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cmpile-stamp-")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        # Host tools on PATH, as on a Linux machine without the bundled Windows ones
+        bin_dir = os.path.join(self.root, "bin")
+        os.makedirs(bin_dir)
+        for name in ("git", "g++", "vcpkg"):
+            path = os.path.join(bin_dir, name)
+            with open(path, 'w') as f:
+                f.write("#!/bin/sh\n")
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+        missing = os.path.join(self.root, "missing")
+        patches = [
+            mock.patch.dict(os.environ, {"PATH": bin_dir}),
+            mock.patch.object(cmpile, "INTERNAL_DOWNLOADS", self.root),
+            mock.patch.object(cmpile, "TOOLCHAIN_STAMP_PATH", os.path.join(self.root, "toolchain_stamp.json")),
+            mock.patch.object(cmpile, "GIT_EXE", os.path.join(missing, "git.exe")),
+            mock.patch.object(cmpile, "GPP_EXE", os.path.join(missing, "clang++.exe")),
+            mock.patch.object(cmpile, "VCPKG_EXE", os.path.join(missing, "vcpkg.exe")),
+            mock.patch.object(download_script, "install_git"),
+            mock.patch.object(download_script, "install_gcc"),
+            mock.patch.object(download_script, "install_vcpkg"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_fingerprint_uses_host_tools(self):
+        fingerprint = cmpile.toolchain_fingerprint()
+        self.assertIsNotNone(fingerprint)
+        self.assertEqual(fingerprint["git"][0], os.path.join(self.root, "bin", "git"))
+        self.assertEqual(fingerprint["compiler"][0], os.path.join(self.root, "bin", "g++"))
+
+    def test_second_start_skips_provisioning(self):
+        log = lambda message, style="": None
+        cmpile.ensure_environment(log)
+        self.assertEqual(download_script.install_gcc.call_count, 1)
+        self.assertTrue(cmpile.toolchain_is_validated())
+
+        cmpile.ensure_environment(log)
+        self.assertEqual(download_script.install_git.call_count, 1)
+        self.assertEqual(download_script.install_gcc.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
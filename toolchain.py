@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import subprocess
+import concurrent.futures
+
+# Everything Cmpile may pick from PATH: compilers, linkers, archivers and profilers
+TOOLS = ("clang", "clang++", "gcc", "g++", "ld.lld", "mold", "ar", "llvm-ar", "gcc-ar", "llvm-profdata", "perf", "gprof")
+COMPILERS = ("clang", "clang++", "gcc", "g++")
+
+PROBE_VERSION = 2
+# Probe results for this many PATH values are kept (CLI, GUI, shells with extra folders)
+MAX_ENTRIES = 8
+
+VERSION_RE = re.compile(r"(\d+)\.(\d+)(?:\.(\d+))?")
+
+def path_key(path_env=None):
+    """
+    Identifies the PATH the tools were found on: the PATH string plus the
+    mtime of every folder on it, so installing a tool into one of them
+    triggers a new probe.
+    """
+    path_env = os.environ.get("PATH", "") if path_env is None else path_env
+    stamps = []
+    for directory in path_env.split(os.pathsep):
+        try:
+            stamps.append(os.stat(directory).st_mtime_ns)
+        except OSError:
+            stamps.append(None)
+    return hashlib.sha1(json.dumps([path_env, stamps]).encode("utf-8")).hexdigest()
+
+def _stamp(path):
+    """[size, mtime_ns] of a tool binary, or None when it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+def _probe_tool(name):
+    """Locates one tool and asks it for its version. Returns its record, or None if missing."""
+    path = shutil.which(name)
+    if not path:
+        return None
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10,
+                                encoding='utf-8', errors='replace')
+        banner = (result.stdout or result.stderr).strip().splitlines()
+        banner = banner[0] if banner else ""
+    except (OSError, subprocess.SubprocessError):
+        banner = ""
+    match = VERSION_RE.search(banner)
+    lowered = banner.lower()
+    family = "clang" if "clang" in lowered else "gcc" if ("gcc" in lowered or "g++" in lowered or "free software" in lowered) else None
+    return {
+        "path": path,
+        "stamp": _stamp(path),
+        "version": match.group(0) if match else None,
+        "major": int(match.group(1)) if match else None,
+        "family": family,
+    }
+
+def _capabilities(record, tools):
+    """What a compiler driver supports, judged from its family and version."""
+    family, major = record["family"], record["major"] or 0
+    return {
+        "pch": family in ("gcc", "clang"),
+        "time_trace": family == "clang" and major >= 9,
+        "split_dwarf": family in ("gcc", "clang"),
+        # GCC accepts -fuse-ld=lld from version 9 on
+        "lld": tools.get("ld.lld") is not None and (family == "clang" or (family == "gcc" and major >= 9)),
+        "mold": tools.get("mold") is not None and (family == "clang" or (family == "gcc" and major >= 12)),
+    }
+
+class Toolchain:
+    """
+    The tools available on PATH, probed once: where each one is, its
+    version and, for compilers, which features it supports. Choosing a
+    compiler or linker afterwards is a dictionary lookup.
+
+    Use get_toolchain() rather than creating one directly; it reuses the
+    result for the rest of the session and across runs while PATH is
+    unchanged.
+    """
+    def __init__(self, tools):
+        # name -> {"path", "version", "major", "family", "capabilities"} or None
+        self.tools = tools
+
+    @classmethod
+    def probe(cls, names=TOOLS):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(names)) as pool:
+            tools = dict(zip(names, pool.map(_probe_tool, names)))
+        for name in COMPILERS:
+            if tools.get(name):
+                tools[name]["capabilities"] = _capabilities(tools[name], tools)
+        return cls(tools)
+
+    @classmethod
+    def load(cls, cache_path=None, names=TOOLS):
+        """Returns the probe saved for the current PATH, probing (and saving) if there is none."""
+        key = path_key()
+        entries = {}
+        if cache_path:
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == PROBE_VERSION:
+                    entries = data.get("entries", {})
+            except (OSError, ValueError):
+                pass
+        entry = entries.get(key)
+        if entry and set(entry["tools"]) == set(names):
+            toolchain = cls(entry["tools"])
+            if not toolchain.changed():
+                return toolchain
+
+        toolchain = cls.probe(names)
+        if cache_path:
+            entries.pop(key, None)
+            entries[key] = {"tools": toolchain.tools}
+            # Dicts keep insertion order, so the oldest probes go first
+            while len(entries) > MAX_ENTRIES:
+                entries.pop(next(iter(entries)))
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+                tmp_path = cache_path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"version": PROBE_VERSION, "entries": entries}, f, indent=1)
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                pass
+        return toolchain
+
+    def changed(self):
+        """
+        True when a compiler was replaced in place (same folder, new size or
+        mtime) since it was probed; path_key() only notices new files.
+        """
+        return any(self.tools.get(name) and self.tools[name].get("stamp") != _stamp(self.tools[name]["path"])
+                   for name in COMPILERS)
+
+    def has(self, name):
+        return self.tools.get(name) is not None
+
+    def find(self, *names):
+        """The first of the given tools that is available, or None."""
+        for name in names:
+            if self.has(name):
+                return name
+        return None
+
+    def path(self, name):
+        record = self.tools.get(name)
+        return record["path"] if record else None
+
+    def version(self, name):
+        record = self.tools.get(name)
+        return record["version"] if record else None
+
+    def _compiler_record(self, compiler):
+        return self.tools.get(compiler) or self.tools.get(os.path.splitext(os.path.basename(compiler))[0])
+
+    def family(self, compiler):
+        """"clang" or "gcc" for a compiler name or path, guessing from the name if it wasn't probed."""
+        record = self._compiler_record(compiler)
+        if record and record.get("family"):
+            return record["family"]
+        return "clang" if "clang" in os.path.basename(compiler) else "gcc"
+
+    def supports(self, compiler, capability):
+        """
+        True if `compiler` (a name from COMPILERS or a path to one) supports
+        the capability. Compilers that were not probed are assumed to be
+        GCC-compatible without optional features.
+        """
+        record = self._compiler_record(compiler)
+        if not record or "capabilities" not in record:
+            return capability in ("pch", "split_dwarf")
+        return record["capabilities"].get(capability, False)
+
+_session = {}
+
+def get_toolchain(cache_path=None):
+    """The toolchain for the current PATH; probed at most once per PATH per session."""
+    path_env = os.environ.get("PATH", "")
+    toolchain = _session.get(path_env)
+    if toolchain is None:
+        toolchain = Toolchain.load(cache_path)
+        _session[path_env] = toolchain
+    return toolchain
+
+def forget_session():
+    """Drops the toolchains probed by this session; the next get_toolchain() checks again."""
+    _session.clear()
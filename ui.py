@@ -1,28 +1,70 @@
+import os
 import argparse
-from rich.console import Console
-from rich.panel import Panel
-from rich.prompt import Confirm
 
-console = Console()
+import project
+
+# rich is imported on first use so that importing ui (and cmpile) stays cheap
+_console = None
+
+def get_console():
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Cmpile V2 - Compile and Run C/C++ code with ease.")
-    parser.add_argument("files", nargs='+', help="The C or C++ files to compile and run.")
+    parser.add_argument("files", nargs='*', help="The C or C++ files to compile and run (default: the targets in cmpile.json).")
+    parser.add_argument("--project", metavar="PATH", help="Build the targets of a project file (default: ./cmpile.json when no files are given).")
+    parser.add_argument("--target", dest="targets", action="append", metavar="NAME", help="Only build this project target and what it depends on (repeatable).")
     parser.add_argument("--compiler-flags", help="Additional compiler flags (quoted string).", default="")
     parser.add_argument("--clean", action="store_true", help="Force clean build (re-download/re-install if needed).")
-    return parser.parse_args()
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of files to compile in parallel (default: CPU count).")
+    parser.add_argument("-k", "--keep-going", action="store_true", help="Keep compiling after a failure and report every failing file.")
+    parser.add_argument("--unity", action="store_true", help="Unity build: compile the files as amalgamated groups (one per job by default).")
+    parser.add_argument("--unity-groups", type=int, metavar="N", help="Number of unity groups per language (implies --unity).")
+    parser.add_argument("--no-pch", action="store_true", help="Do not precompile headers shared by many files.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the shared compiled-object cache.")
+    parser.add_argument("--cache-stats", action="store_true", help="Show object cache statistics.")
+    parser.add_argument("--cache-clear", action="store_true", help="Delete every entry in the object cache.")
+    parser.add_argument("--watch", action="store_true", help="Rebuild and rerun whenever a source file or one of its headers is saved.")
+    parser.add_argument("--server", action="store_true", help="Run a persistent build server that keeps caches warm between builds.")
+    parser.add_argument("--use-server", action="store_true", help="Send the build to a running build server (falls back to a local build).")
+    parser.add_argument("--server-stop", action="store_true", help="Stop the running build server.")
+    parser.add_argument("--startup-profile", action="store_true", help="Report how long imports and environment setup took.")
+    parser.add_argument("--fuse-ld", metavar="LINKER", help="Linker for the compiler driver to use: auto (mold or lld when available, the default), default, lld, mold, gold or bfd.")
+    parser.add_argument("--split-debug", action="store_true", help="Keep debug info in separate .dwo files (-gsplit-dwarf) so links have less to copy.")
+    parser.add_argument("--variant", choices=("debug", "release", "native", "pgo"), help="Build variant, each in its own out/<variant> folder: debug (-O0 -g), release (-O2, LTO), native (release plus -march=native) or pgo (profile-guided release build).")
+    parser.add_argument("--pgo-train", metavar="ARGS", help="Arguments for the PGO training run of the instrumented program.")
+    parser.add_argument("--pgo-input", metavar="FILE", help="File fed to the PGO training run on stdin.")
+    parser.add_argument("--bench", type=int, metavar="N", help="Instead of running the program once, time N runs and compare them with the previous build.")
+    parser.add_argument("--bench-warmup", type=int, default=1, metavar="N", help="Untimed runs before --bench measures (default: 1).")
+    parser.add_argument("--bench-output", metavar="FILE", help="Write the benchmarked program's stdout here instead of discarding it.")
+    parser.add_argument("--profile-run", action="store_true", help="Rebuild with profiling support, run under perf (or gprof) and report the hottest functions.")
+    parser.add_argument("--run-timeout", type=float, metavar="SECONDS", help="Stop the program if it runs longer than this.")
+    parser.add_argument("--memory-limit", type=float, metavar="MB", help="Cap the program's memory (Linux/macOS only).")
+    parser.add_argument("--trace", action="store_true", help="Write per-phase and per-file timings as a Chrome trace to out/trace.json.")
+    parser.add_argument("--trace-file", metavar="PATH", help="Write the --trace output here instead (implies --trace).")
+    args = parser.parse_args()
+    has_project = args.project or os.path.exists(project.MANIFEST_FILE)
+    if not args.files and not (has_project or args.cache_stats or args.cache_clear or args.server or args.server_stop):
+        parser.error("the following arguments are required: files")
+    return args
 
 def display_header():
-    console.print(Panel.fit("[bold cyan]Cmpile V2[/bold cyan]", border_style="cyan"))
+    from rich.panel import Panel
+    get_console().print(Panel.fit("[bold cyan]Cmpile V2[/bold cyan]", border_style="cyan"))
 
 def display_status(message, style="bold blue"):
-    console.print(f"[{style}]{message}[/{style}]")
+    get_console().print(f"[{style}]{message}[/{style}]")
 
 def display_error(message):
-    console.print(f"[bold red]Error: {message}[/bold red]")
+    get_console().print(f"[bold red]Error: {message}[/bold red]")
 
 def display_success(message):
-    console.print(f"[bold green]{message}[/bold green]")
+    get_console().print(f"[bold green]{message}[/bold green]")
 
 def get_user_confirmation(prompt_message):
+    from rich.prompt import Confirm
     return Confirm.ask(f"[yellow]{prompt_message}[/yellow]")
@@ -0,0 +1,116 @@
+import os
+import json
+
+import build_state
+
+UNITY_DIR = "unity"
+PLAN_FILE = "groups.json"
+
+C_EXTENSIONS = ('.c',)
+
+def _language(path):
+    lower = path.lower()
+    if lower.endswith(build_state.CPP_EXTENSIONS):
+        return "cpp"
+    if lower.endswith(C_EXTENSIONS):
+        return "c"
+    return None
+
+class UnityPlan:
+    """
+    Groups translation units into amalgamation ("unity") files that include
+    them, with separate groups for C and C++ sources.
+
+    The assignment of files to groups is saved in out/unity/groups.json and
+    reused, so editing a file only rebuilds the group that contains it.
+    New files go into the smallest group. Files that broke a unity build are
+    remembered as excluded and are compiled on their own from then on.
+    """
+    def __init__(self, out_dir, groups):
+        self.unity_dir = os.path.join(out_dir, UNITY_DIR)
+        self.plan_path = os.path.join(self.unity_dir, PLAN_FILE)
+        self.groups = max(1, groups)
+        self.assignment = {}
+        self.excluded = set()
+        self.members = {}
+        try:
+            with open(self.plan_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("groups") == self.groups:
+                self.assignment = data.get("assignment", {})
+            self.excluded = set(data.get("excluded", []))
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        os.makedirs(self.unity_dir, exist_ok=True)
+        tmp_path = self.plan_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"groups": self.groups, "assignment": self.assignment,
+                       "excluded": sorted(self.excluded)}, f, indent=1)
+        os.replace(tmp_path, self.plan_path)
+
+    def prepare(self, files):
+        """
+        Writes the unity files for the given sources and returns the list of
+        files to compile instead: unity files plus every source that is
+        excluded, is alone in its group, or is not C/C++.
+        """
+        os.makedirs(self.unity_dir, exist_ok=True)
+        by_language = {"c": [], "cpp": []}
+        units = []
+        for src in files:
+            language = _language(src)
+            if language is None or src in self.excluded:
+                units.append(src)
+            else:
+                by_language[language].append(src)
+
+        assignment = {}
+        self.members = {}
+        for language, sources in by_language.items():
+            sizes = [0] * self.groups
+            fresh = []
+            for src in sorted(sources):
+                group = self.assignment.get(src)
+                if group is not None and group < self.groups:
+                    assignment[src] = group
+                    sizes[group] += 1
+                else:
+                    fresh.append(src)
+            for src in fresh:
+                group = sizes.index(min(sizes))
+                assignment[src] = group
+                sizes[group] += 1
+
+            for group in range(self.groups):
+                members = sorted(src for src in sources if assignment[src] == group)
+                if len(members) == 1:
+                    units.extend(members)
+                elif members:
+                    unity_path = os.path.abspath(os.path.join(self.unity_dir, f"unity_{language}_{group}.{language}"))
+                    # Only rewritten when the member list changed, so its mtime stays stable
+                    text = "".join(f'#include "{src.replace(os.sep, "/")}"\n' for src in members)
+                    build_state.write_if_changed(unity_path, text)
+                    self.members[unity_path] = members
+                    units.append(unity_path)
+
+        self.assignment = assignment
+        self.save()
+        return units
+
+    def is_unity_file(self, path):
+        return path in self.members
+
+    def exclude(self, members, diagnostics):
+        """
+        Excludes the members of a failed group that compile fine on their own.
+        Members named in the unity compile's diagnostics are taken as the
+        culprits; if none can be identified the whole group is excluded.
+        Returns the excluded files.
+        """
+        culprits = [src for src in members if src in diagnostics or os.path.basename(src) in diagnostics]
+        culprits = culprits or list(members)
+        self.excluded.update(culprits)
+        self.save()
+        return culprits
@@ -0,0 +1,74 @@
+import os
+
+VARIANTS = ("debug", "release", "native", "pgo")
+
+# Profile-guided builds run in two stages that share one output folder, so
+# the optimized compile finds the profile the instrumented objects wrote
+PGO_GENERATE = "pgo-generate"
+PGO_USE = "pgo-use"
+PGO_DIR = "pgo"
+PROFILE_DIR = "profile"
+PROFDATA_FILE = "merged.profdata"
+
+# Builds for --profile-run: frame pointers for perf's stack walks, or gprof instrumentation
+PROFILE_FP = "profile"
+PROFILE_PG = "profile-pg"
+
+def output_dir(out_dir, variant):
+    """Each variant builds into its own folder under out/, so switching never invalidates another."""
+    if not variant:
+        return out_dir
+    if variant in (PGO_GENERATE, PGO_USE):
+        return os.path.join(out_dir, PGO_DIR)
+    return os.path.join(out_dir, variant)
+
+def _lto(family):
+    # ThinLTO for clang; GCC parallelises its LTO link with =auto
+    return ["-flto=thin"] if family == "clang" else ["-flto=auto"]
+
+def flags(variant, family, variant_dir=None):
+    """
+    Returns (compile_flags, link_flags) for a variant and compiler family
+    ("gcc" or "clang"). They go before the user's own flags, which can
+    still override them. No variant means no extra flags.
+    """
+    if not variant:
+        return [], []
+    release = ["-O2", "-DNDEBUG"]
+    if variant == "debug":
+        return ["-O0", "-g"], []
+    if variant == "release":
+        return release + _lto(family), ["-O2"] + _lto(family)
+    if variant == "native":
+        return release + ["-march=native"] + _lto(family), ["-O2", "-march=native"] + _lto(family)
+
+    if variant == PROFILE_FP:
+        return ["-O2", "-g", "-fno-omit-frame-pointer"], []
+    if variant == PROFILE_PG:
+        return ["-O2", "-g", "-pg"], ["-pg"]
+
+    profile_dir = os.path.join(variant_dir or "", PROFILE_DIR)
+    if variant == PGO_GENERATE:
+        if family == "clang":
+            generate = [f"-fprofile-generate={profile_dir}"]
+        else:
+            # Counters next to each object; atomic updates keep threaded programs' counts sane
+            generate = ["-fprofile-generate", "-fprofile-update=atomic"]
+        return ["-O2"] + generate, generate
+    if variant == PGO_USE:
+        if family == "clang":
+            use = [f"-fprofile-use={os.path.join(variant_dir or '', PROFDATA_FILE)}", "-Wno-profile-instr-unprofiled"]
+        else:
+            use = ["-fprofile-use", "-fprofile-correction", "-Wno-missing-profile"]
+        return release + use + _lto(family), ["-O2"] + _lto(family)
+    raise ValueError(f"Unknown build variant '{variant}' (expected one of {', '.join(VARIANTS)})")
+
+def clear_profile(variant_dir):
+    """Deletes the counters of earlier training runs."""
+    removed = 0
+    for folder, _, names in os.walk(variant_dir):
+        for name in names:
+            if name.endswith((".gcda", ".profraw", ".profdata")):
+                os.remove(os.path.join(folder, name))
+                removed += 1
+    return removed
@@ -1,26 +1,109 @@
 import os
 import subprocess
 
+def parse_status_file(path):
+    """
+    Parses a vcpkg status database file (Debian control format) into a list
+    of paragraphs, each a dict of field -> value.
+    """
+    paragraphs = []
+    current = {}
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if not line.strip():
+                    if current:
+                        paragraphs.append(current)
+                        current = {}
+                    continue
+                if line[0] in " \t":
+                    # Continuation of the previous field; not needed for status checks
+                    continue
+                key, _, value = line.partition(":")
+                current[key.strip()] = value.strip()
+    except OSError:
+        return paragraphs
+    if current:
+        paragraphs.append(current)
+    return paragraphs
+
 class VcpkgManager:
-    def __init__(self, internal_downloads_path, log_func=print):
+    def __init__(self, internal_downloads_path, log_func=print, vcpkg_exe=None):
         self.vcpkg_root = os.path.join(internal_downloads_path, "vcpkg")
-        self.vcpkg_exe = os.path.join(self.vcpkg_root, "vcpkg.exe")
+        self.vcpkg_exe = vcpkg_exe or os.path.join(self.vcpkg_root, "vcpkg.exe")
         self.triplet = "x64-mingw-dynamic"
         self.log_func = log_func
+        self._status_stamp = None
+        self._installed = set()
 
     def is_installed(self):
         return os.path.exists(self.vcpkg_exe)
 
+    def _status_files(self):
+        """The status database plus pending incremental updates, oldest first."""
+        db_dir = os.path.join(self.vcpkg_root, "installed", "vcpkg")
+        files = [os.path.join(db_dir, "status")]
+        updates_dir = os.path.join(db_dir, "updates")
+        if os.path.isdir(updates_dir):
+            files.extend(os.path.join(updates_dir, name) for name in sorted(os.listdir(updates_dir)))
+        return files
+
+    def installed_packages(self):
+        """
+        Returns the set of port names installed for this triplet, read from
+        vcpkg's status database. The parsed view is reused until one of the
+        database files changes.
+        """
+        files = self._status_files()
+        stamp = []
+        for path in files:
+            try:
+                st = os.stat(path)
+                stamp.append((path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                pass
+        if stamp == self._status_stamp:
+            return self._installed
+
+        # Later paragraphs (updates) override earlier ones for the same package
+        states = {}
+        for path in files:
+            for para in parse_status_file(path):
+                if para.get("Feature") or para.get("Architecture") != self.triplet:
+                    continue
+                states[para.get("Package")] = para.get("Status", "")
+        self._installed = {pkg for pkg, status in states.items() if status.endswith(" installed")}
+        self._status_stamp = stamp
+        return self._installed
+
+    def missing_packages(self, package_names):
+        """Returns the packages (in the given order) not yet installed for this triplet."""
+        installed = self.installed_packages()
+        return [pkg for pkg in package_names if pkg not in installed]
+
     def install_package(self, package_name):
+        return self.install_many([package_name])
+
+    def install_many(self, package_names):
+        """
+        Installs every missing package with a single vcpkg invocation.
+        Returns True without starting a process when all are already installed.
+        """
+        missing = self.missing_packages(package_names)
+        if not missing:
+            return True
+
         if not self.is_installed():
             self.log_func("vcpkg not found. Please run caching/download script first.", "bold red")
             return False
 
-        self.log_func(f"Installing {package_name} for {self.triplet}...")
+        package_list = ", ".join(missing)
+        self.log_func(f"Installing {package_list} for {self.triplet}...")
         try:
             # Capture output to log it, providing feedback without printing directly
             process = subprocess.Popen(
-                [self.vcpkg_exe, "install", f"{package_name}:{self.triplet}", f"--host-triplet={self.triplet}"],
+                [self.vcpkg_exe, "install"] + [f"{pkg}:{self.triplet}" for pkg in missing] + [f"--host-triplet={self.triplet}"],
                 cwd=self.vcpkg_root,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
@@ -39,15 +122,15 @@ class VcpkgManager:
 
             if process.returncode != 0:
                 stderr_output = process.stderr.read() if process.stderr else "No stderr output."
-                self.log_func(f"Failed to install {package_name}.", "bold red")
+                self.log_func(f"Failed to install {package_list}.", "bold red")
                 if stderr_output.strip():
                     self.log_func(f"Stderr:\n{stderr_output.strip()}", "bold red")
                 return False
 
-            self.log_func(f"Successfully installed {package_name}.", "bold green")
+            self.log_func(f"Successfully installed {package_list}.", "bold green")
             return True
         except Exception as e:
-            self.log_func(f"An exception occurred while installing {package_name}: {e}", "bold red")
+            self.log_func(f"An exception occurred while installing {package_list}: {e}", "bold red")
             return False
 
     def get_installed_path(self):
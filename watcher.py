@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import select
+import struct
+
+# inotify event masks (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct("iIII")
+
+POLL_INTERVAL = 0.5
+
+def _load_inotify():
+    """Returns libc if inotify is available, else None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class FileWatcher:
+    """
+    Waits for changes to a set of files.
+    Uses inotify on Linux, watching the folders that contain the files so
+    editors that save by renaming a temp file are noticed too. Elsewhere it
+    falls back to polling the files' size and mtime. Bursts of events are
+    debounced into one change set.
+    """
+    def __init__(self, debounce=0.3):
+        self.debounce = debounce
+        self.paths = set()
+        self._fd = None
+        self._libc = _load_inotify()
+        self._dirs = {}
+        self._snapshot = {}
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+        self.backend = "inotify" if self._fd is not None else "polling"
+
+    def watch_paths(self, paths):
+        """Adds files to the watched set; files already watched keep their state."""
+        for path in paths:
+            path = os.path.abspath(path)
+            if path in self.paths:
+                continue
+            self.paths.add(path)
+            self._snapshot[path] = self._stat(path)
+            directory = os.path.dirname(path)
+            if self._fd is not None and directory not in self._dirs.values():
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+                if wd >= 0:
+                    self._dirs[wd] = directory
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+            return (st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    def _read_events(self, timeout):
+        """Returns the watched files named by inotify events that arrive within timeout."""
+        changed = set()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return changed
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            directory = self._dirs.get(wd)
+            if directory and name:
+                path = os.path.join(directory, os.fsdecode(name))
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def _poll(self):
+        changed = set()
+        for path in self.paths:
+            current = self._stat(path)
+            if current != self._snapshot.get(path):
+                self._snapshot[path] = current
+                changed.add(path)
+        return changed
+
+    def _collect(self, timeout):
+        if self._fd is not None:
+            return self._read_events(timeout)
+        time.sleep(timeout)
+        return self._poll()
+
+    def wait_for_change(self, stop_event=None):
+        """
+        Blocks until at least one watched file changes and returns the set
+        of changed files once no further change arrived for `debounce`
+        seconds. Returns an empty set if stop_event gets set first.
+        """
+        changed = set()
+        while not changed:
+            if stop_event is not None and stop_event.is_set():
+                return set()
+            changed = self._collect(POLL_INTERVAL)
+
+        while True:
+            more = self._collect(self.debounce)
+            if not more:
+                break
+            changed |= more
+
+        if self._fd is not None:
+            # Keep the polling snapshot in sync in case inotify is dropped later
+            for path in changed:
+                self._snapshot[path] = self._stat(path)
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None